@@ -0,0 +1,266 @@
+"""Route large origin-destination files through the +15 network in parallel.
+
+    python app/batch_routing.py pairs.csv routes.parquet --workers 8 --geometry
+
+Each input row needs an origin and a destination, given either as
+coordinates (origin_lon, origin_lat, dest_lon, dest_lat) or as business ids
+from calgary_businesses.feather (origin_busid, dest_busid), matched against
+the --business-key column. Any other columns are copied through to the
+output. distance_m and time_s include the walk between each endpoint and the
+network (origin_snap_m, dest_snap_m). Endpoints further than --max-snap metres
+from the network are left unrouted.
+"""
+import os
+import signal
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data import businessLocal, businessPoints
+from centerlines import load_or_build
+from network import Plus15Network, WALKING_SPEED, MERCATOR_SCALE, to_web_mercator, to_lon_lat
+from shared_arrays import SharedArrays, attach_arrays
+from map_matching import MAX_SEARCH_RADIUS
+
+CHUNK_ROWS = 200_000
+# Single-node searches kept per worker; neighbouring origin segments share end nodes
+SEARCH_CACHE_SIZE = 512
+# Business dataset column that origin_busid/dest_busid refer to
+BUSINESS_KEY = "getbusid"
+
+# Endpoints further than this from the network (ground metres) aren't routed; same radius the map snaps fixes within
+MAX_SNAP_DISTANCE = MAX_SEARCH_RADIUS
+
+# Per-worker state, attached in init_worker
+WORKER = {}
+
+def init_worker(spec):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    arrays, blocks = attach_arrays(spec)
+    WORKER["blocks"] = blocks
+    WORKER["network"] = Plus15Network.from_arrays(arrays)
+    WORKER["searches"] = OrderedDict()
+
+def node_search(node):
+    """Cached distances and predecessors from one node; returns them and whether a search was run"""
+    searches = WORKER["searches"]
+    found = searches.get(node)
+    if found is not None:
+        searches.move_to_end(node)
+        return found, False
+    dist, pred = WORKER["network"].search([(node, 0.0)])
+    found = (np.asarray(dist), pred)
+    searches[node] = found
+    if len(searches) > SEARCH_CACHE_SIZE:
+        searches.popitem(last=False)
+    return found, True
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Stream a CSV or Parquet file as DataFrames of at most chunk_rows rows"""
+    if path.lower().endswith((".parquet", ".pq")):
+        parquet = pq.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+class EndpointResolver:
+    """Turns coordinate or business-id columns into projected origin/destination points"""
+    def __init__(self, business_df=None, key=BUSINESS_KEY):
+        self.business_lookup = None
+        if business_df is not None:
+            if key not in business_df.columns:
+                raise ValueError(f"business dataset has no '{key}' column")
+            xs, ys = businessPoints(business_df)
+            self.business_lookup = pd.DataFrame({"x": xs, "y": ys}, index=business_df[key].to_numpy())
+            self.business_lookup = self.business_lookup[~self.business_lookup.index.duplicated()]
+
+    def resolve(self, chunk, prefix):
+        if f"{prefix}_lon" in chunk.columns:
+            return to_web_mercator(chunk[f"{prefix}_lon"].to_numpy(float), chunk[f"{prefix}_lat"].to_numpy(float))
+        if f"{prefix}_busid" in chunk.columns and self.business_lookup is not None:
+            found = self.business_lookup.reindex(chunk[f"{prefix}_busid"].to_numpy())
+            return found["x"].to_numpy(), found["y"].to_numpy()
+        raise ValueError(f"input needs {prefix}_lon/{prefix}_lat or {prefix}_busid columns")
+
+def snap_endpoints(network, xs, ys, max_snap=MAX_SNAP_DISTANCE):
+    """Nearest segment, fraction along it and snap distance (ground metres) per point
+
+    The segment is -1 where the point is missing or more than max_snap metres from the network.
+    """
+    valid = np.isfinite(xs) & np.isfinite(ys)
+    segments = np.full(len(xs), -1, dtype=np.int64)
+    fractions = np.zeros(len(xs))
+    distances = np.full(len(xs), np.nan)
+    if valid.any():
+        s, f, d = network.locate_many(xs[valid], ys[valid])
+        segments[valid] = s
+        fractions[valid] = f
+        distances[valid] = d * MERCATOR_SCALE
+        segments[distances > max_snap] = -1
+    return segments, fractions, distances
+
+def route_group(job):
+    """Runs in a worker: searches from both ends of one origin segment, read for every row starting on it"""
+    network = WORKER["network"]
+    origin_segment, origin_fractions, dest_segments, dest_fractions, want_geometry = job
+
+    length = network.seg_length
+    origin_length = length[origin_segment]
+    ends = (int(network.seg_u[origin_segment]), int(network.seg_v[origin_segment]))
+    searches, ran = zip(*(node_search(end) for end in ends))
+    end_dist = [dist for dist, _ in searches]
+
+    # Each row leaves its origin through whichever segment end is shorter overall
+    to_u = origin_fractions * origin_length
+    to_v = (1 - origin_fractions) * origin_length
+    def reach(nodes):
+        via_u = to_u + end_dist[0][nodes]
+        via_v = to_v + end_dist[1][nodes]
+        return np.minimum(via_u, via_v), np.where(via_u <= via_v, 0, 1)
+
+    dest_u = network.seg_u[dest_segments]
+    dest_v = network.seg_v[dest_segments]
+    du, du_end = reach(dest_u)
+    dv, dv_end = reach(dest_v)
+    du = du + dest_fractions * length[dest_segments]
+    dv = dv + (1 - dest_fractions) * length[dest_segments]
+    distances = np.minimum(du, dv)
+
+    # Destinations on the origin's own segment can be reached directly along it
+    same = dest_segments == origin_segment
+    distances[same] = np.abs(dest_fractions[same] - origin_fractions[same]) * origin_length
+
+    geometries = None
+    if want_geometry:
+        ux, uy = network.node_x[ends[0]], network.node_y[ends[0]]
+        vx, vy = network.node_x[ends[1]], network.node_y[ends[1]]
+        geometries = []
+        for k in range(len(dest_segments)):
+            if not np.isfinite(distances[k]):
+                geometries.append(None)
+                continue
+            f = origin_fractions[k]
+            origin = (ux + f * (vx - ux), uy + f * (vy - uy))
+            s = dest_segments[k]
+            ax, ay = network.node_x[dest_u[k]], network.node_y[dest_u[k]]
+            bx, by = network.node_x[dest_v[k]], network.node_y[dest_v[k]]
+            f = dest_fractions[k]
+            end = (ax + f * (bx - ax), ay + f * (by - ay))
+            if same[k]:
+                coords = [origin, end]
+            else:
+                node, start = (dest_u[k], du_end[k]) if du[k] <= dv[k] else (dest_v[k], dv_end[k])
+                path = network.node_path(searches[start][1], int(node))[::-1]
+                coords = [origin] + network.node_coordinates(path) + [end]
+            geometries.append(coords)
+
+    return distances, geometries, sum(ran)
+
+def wkt_linestring(coords):
+    if coords is None or len(coords) < 2:
+        return None
+    lons, lats = to_lon_lat(*np.asarray(coords).T)
+    return "LINESTRING (" + ", ".join(f"{lon:.7f} {lat:.7f}" for lon, lat in zip(lons, lats)) + ")"
+
+def route_chunk(pool, workers, network, chunk, resolver, want_geometry, max_snap=MAX_SNAP_DISTANCE):
+    """Route one chunk, grouping rows that share an origin segment into one pair of searches"""
+    origin_segments, origin_fractions, origin_snap = snap_endpoints(network, *resolver.resolve(chunk, "origin"), max_snap)
+    dest_segments, dest_fractions, dest_snap = snap_endpoints(network, *resolver.resolve(chunk, "dest"), max_snap)
+
+    distances = np.full(len(chunk), np.inf)
+    geometries = [None] * len(chunk) if want_geometry else None
+
+    valid = (origin_segments >= 0) & (dest_segments >= 0)
+    keys = pd.Series(origin_segments)[valid]
+
+    groups = []
+    jobs = []
+    for segment, rows in keys.groupby(keys, sort=False).indices.items():
+        rows = np.flatnonzero(valid)[rows]
+        groups.append(rows)
+        jobs.append((int(segment), origin_fractions[rows], dest_segments[rows], dest_fractions[rows], want_geometry))
+
+    # Several groups per task amortise inter-process overhead; 4 tasks per worker keeps them balanced
+    chunksize = max(1, len(jobs) // (4 * workers))
+    searches = 0
+    for rows, (group_distances, group_geometries, group_searches) in zip(
+            groups, pool.map(route_group, jobs, chunksize=chunksize)):
+        distances[rows] = group_distances
+        searches += group_searches
+        if want_geometry:
+            for row, coords in zip(rows, group_geometries):
+                geometries[row] = wkt_linestring(coords)
+
+    # Include the walk between each endpoint and the network, as travel costs elsewhere do
+    distances = distances + origin_snap + dest_snap
+
+    result = chunk.copy()
+    reachable = np.isfinite(distances)
+    result["reachable"] = reachable
+    result["distance_m"] = np.where(reachable, np.round(distances, 1), np.nan)
+    result["time_s"] = np.where(reachable, np.round(distances / WALKING_SPEED, 1), np.nan)
+    # How far each endpoint is from the network it was routed through
+    result["origin_snap_m"] = np.round(origin_snap, 1)
+    result["dest_snap_m"] = np.round(dest_snap, 1)
+    if want_geometry:
+        result["path_wkt"] = geometries
+    return result, searches
+
+def run(input_path, output_path, workers=None, want_geometry=False, chunk_rows=CHUNK_ROWS,
+        max_snap=MAX_SNAP_DISTANCE, business_key=BUSINESS_KEY):
+    network = Plus15Network.from_lines(load_or_build().to_crs(epsg=3857))
+    resolver = EndpointResolver(businessLocal(), business_key)
+    shared = SharedArrays(network.arrays())
+
+    workers = workers or os.cpu_count()
+    writer = None
+    total_rows = 0
+    total_searches = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker, initargs=(shared.spec,)) as pool:
+            for chunk in read_chunks(input_path, chunk_rows):
+                result, searches = route_chunk(pool, workers, network, chunk, resolver, want_geometry, max_snap)
+                table = pa.Table.from_pandas(result, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    if want_geometry:
+                        # A first chunk without any reachable pair would otherwise fix the column as null
+                        schema = schema.set(schema.get_field_index("path_wkt"), pa.field("path_wkt", pa.string()))
+                    writer = pq.ParquetWriter(output_path, schema)
+                writer.write_table(table.cast(writer.schema))
+
+                total_rows += len(result)
+                total_searches += searches
+                print(f"Routed {total_rows} pairs with {total_searches} searches")
+    finally:
+        if writer is not None:
+            writer.close()
+        shared.close()
+
+    print(f"Wrote {total_rows} routes to {output_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch route origin-destination pairs through the +15 network")
+    parser.add_argument("input", help="CSV or Parquet file of origin-destination pairs")
+    parser.add_argument("output", help="Parquet file to write")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--geometry", action="store_true", help="include each path as WKT")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--max-snap", type=float, default=MAX_SNAP_DISTANCE,
+                        help=f"leave pairs unrouted when an endpoint is further than this many metres "
+                             f"from the network (default {MAX_SNAP_DISTANCE})")
+    parser.add_argument("--business-key", default=BUSINESS_KEY,
+                        help=f"business column that *_busid values refer to (default {BUSINESS_KEY})")
+    args = parser.parse_args()
+
+    run(args.input, args.output, args.workers, args.geometry, args.chunk_rows, args.max_snap, args.business_key)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+FILTER_COLUMNS = {
+    "jobstatusdesc": "Licence Status",
+    "homeoccind": "Home Occupation",
+    "licencetypes": "Licence Type",
+}
+
+# Columns holding several values per business, and the separator between them
+MULTI_VALUE_COLUMNS = {"licencetypes": ","}
+
+MISSING_CATEGORY = "N/A"
+
+class BusinessFilterIndex:
+    """Precomputed per-category bitmaps over the business rows.
+
+    Each category of a filter column is stored as a packed bitmap (one bit per
+    business). Selecting categories ORs bitmaps within a column and ANDs the
+    columns together, so any filter combination is a handful of vectorized
+    byte-wise operations regardless of how many businesses are loaded.
+    """
+    def __init__(self, business_df, columns=FILTER_COLUMNS):
+        self.count = len(business_df)
+        self.bitmaps = {}
+        self.selected = {}
+
+        for column in columns:
+            if column not in business_df.columns:
+                continue
+            self.bitmaps[column] = self.column_bitmaps(business_df[column], MULTI_VALUE_COLUMNS.get(column))
+            self.selected[column] = None
+
+        self.all_rows = np.packbits(np.ones(self.count, dtype=bool))
+
+    @staticmethod
+    def column_bitmaps(values, separator=None):
+        values = values.fillna(MISSING_CATEGORY).astype(str).reset_index(drop=True)
+        if separator is None:
+            codes, categories = pd.factorize(values, sort=True)
+            return {category: np.packbits(codes == k) for k, category in enumerate(categories)}
+
+        # One entry per (business, value) pair, indexed by business row
+        exploded = values.str.split(separator).explode().str.strip()
+        rows = exploded.index.to_numpy()
+        codes, categories = pd.factorize(exploded.to_numpy(), sort=True)
+
+        bitmaps = {}
+        for k, category in enumerate(categories):
+            bits = np.zeros(len(values), dtype=bool)
+            bits[rows[codes == k]] = True
+            bitmaps[category] = np.packbits(bits)
+        return bitmaps
+
+    def categories(self, column):
+        """Categories of a column with the number of businesses in each"""
+        return {category: int(np.unpackbits(bits, count=self.count).sum())
+                for category, bits in self.bitmaps[column].items()}
+
+    def set_filter(self, column, categories):
+        """Restrict a column to the given categories; None removes the restriction"""
+        self.selected[column] = None if categories is None else set(categories)
+
+    def clear(self):
+        for column in self.selected:
+            self.selected[column] = None
+
+    def mask(self):
+        """Boolean array of the businesses passing every active filter"""
+        combined = self.all_rows.copy()
+        for column, categories in self.selected.items():
+            if categories is None:
+                continue
+            column_bits = np.zeros_like(combined)
+            for category in categories:
+                bits = self.bitmaps[column].get(category)
+                if bits is not None:
+                    np.bitwise_or(column_bits, bits, out=column_bits)
+            np.bitwise_and(combined, column_bits, out=combined)
+        return np.unpackbits(combined, count=self.count).astype(bool)
@@ -0,0 +1,260 @@
+"""Walkway centerlines for the +15 polygons, cached as a feather snapshot.
+
+    python app/centerlines.py            # rebuild plus15_centerlines.feather
+
+Each walkway polygon is reduced to its medial axis: the Voronoi edges of
+its densified outline that fall inside it. Polygons that touch are merged
+first, so centerlines run continuously from one walkway into the next.
+Spurs the medial axis sends into corners and end caps are pruned, and
+walkway areas separated by a small gap in the source polygons are joined
+with a connector so routes can cross between them.
+
+The snapshot records the source snapshot's size and mtime and the
+extraction parameters, and is rebuilt when either changes.
+"""
+import os
+import json
+import argparse
+from collections import defaultdict
+
+import numpy as np
+import shapely
+import shapely.ops
+import pyarrow as pa
+import pyarrow.feather as feather
+import geopandas as gpd
+
+from data import MAP_SNAPSHOT, mapLocal, paths
+from network import MERCATOR_SCALE
+
+CENTERLINE_SNAPSHOT = "plus15_centerlines.feather"
+CENTERLINE_VERSION = 2
+
+# Distances below are ground metres; geometry is processed in EPSG:3857
+# Gaps between neighbouring polygons smaller than this are closed so they connect
+JOIN_GAP = 1.0
+# Outline vertex spacing fed to the Voronoi diagram
+SAMPLE_SPACING = 1.0
+# Branches ending in a dead end shorter than this are corner spurs
+SPUR_LENGTH = 8.0
+# ...as are those shorter than this many times the walkway half-width at the junction they leave
+SPUR_RATIO = 2.0
+# Walkway areas whose outlines come this close are joined by a connector
+CONNECT_GAP = 8.0
+SIMPLIFY_TOLERANCE = 0.25
+
+def merge_polygons(polygons, gap):
+    """Union polygons that touch or nearly touch into walkable areas"""
+    closed = shapely.buffer(shapely.union_all(shapely.buffer(polygons, gap / 2)), -gap / 2)
+    return shapely.get_parts(closed)
+
+def medial_axis(polygon, spacing):
+    """Segments of the Voronoi diagram of the outline that lie inside the polygon"""
+    outline = shapely.segmentize(polygon, spacing)
+    points = shapely.multipoints(np.unique(shapely.get_coordinates(shapely.boundary(outline)), axis=0))
+    edges = shapely.get_parts(shapely.voronoi_polygons(points, only_edges=True))
+    shapely.prepare(polygon)
+    return edges[shapely.contains_properly(polygon, edges)]
+
+def prune_spurs(edges, spur_length, area=None, spur_ratio=SPUR_RATIO):
+    """Drop dead-end branches that hang off a junction and are short for the walkway around them
+
+    A branch is a spur when it is shorter than spur_length, or, given the
+    walkable area, than spur_ratio times the distance from its junction to
+    the area's outline; that catches the long corner branches of wide rooms.
+    """
+    coords = shapely.get_coordinates(edges).reshape(-1, 2, 2)
+    keys = np.round(coords, 3)
+    nodes, index = np.unique(keys.reshape(-1, 2), axis=0, return_inverse=True)
+    index = index.reshape(-1, 2)
+    lengths = np.hypot(*(coords[:, 1] - coords[:, 0]).T)
+
+    limits = np.full(len(nodes), spur_length)
+    if area is not None:
+        radius = shapely.distance(shapely.boundary(area), shapely.points(nodes))
+        limits = np.maximum(limits, spur_ratio * radius)
+    longest = limits.max()
+
+    adjacency = defaultdict(set)
+    for e, (u, v) in enumerate(index.tolist()):
+        adjacency[u].add(e)
+        adjacency[v].add(e)
+    removed = np.zeros(len(edges), dtype=bool)
+
+    # Newly exposed dead ends may themselves be spurs, so repeat until nothing changes
+    changed = True
+    while changed:
+        changed = False
+        leaves = [node for node, incident in adjacency.items() if len(incident) == 1]
+        for leaf in leaves:
+            if len(adjacency[leaf]) != 1:
+                continue
+            branch = []
+            node = leaf
+            length = 0.0
+            previous = None
+            while True:
+                incident = [e for e in adjacency[node] if e != previous]
+                if len(adjacency[node]) > 2 or not incident:
+                    break
+                edge = incident[0]
+                branch.append(edge)
+                length += lengths[edge]
+                u, v = index[edge]
+                node = v if u == node else u
+                previous = edge
+                if length >= longest:
+                    break
+            # Only branches ending at a junction are spurs; a lone short line is kept whole
+            if len(adjacency[node]) > 2 and length < limits[node]:
+                for edge in branch:
+                    u, v = index[edge]
+                    adjacency[u].discard(edge)
+                    adjacency[v].discard(edge)
+                    removed[edge] = True
+                changed = True
+
+    # Thin tips can leave short pieces cut off from the rest; keep them only if nothing else is left
+    root = list(range(len(nodes)))
+    def find(node):
+        while root[node] != node:
+            root[node] = root[root[node]]
+            node = root[node]
+        return node
+    kept = np.flatnonzero(~removed)
+    for u, v in index[kept].tolist():
+        root[find(u)] = find(v)
+    components = np.array([find(u) for u in index[kept, 0].tolist()], dtype=np.int64)
+    _, component = np.unique(components, return_inverse=True)
+    totals = np.bincount(component, weights=lengths[kept])
+    keep = (totals >= spur_length) | (totals == totals.max())
+    removed[kept[~keep[component]]] = True
+
+    return edges[~removed]
+
+def split_at(lines, point):
+    """Split the line nearest point there, so a connector ending at point meets it at a vertex"""
+    nearest = int(np.argmin(shapely.distance(lines, point)))
+    line = lines[nearest]
+    offset = line.project(point)
+    if 0 < offset < line.length:
+        lines[nearest:nearest + 1] = [shapely.ops.substring(line, 0, offset),
+                                      shapely.ops.substring(line, offset, line.length)]
+    else:
+        point = line.interpolate(offset)
+    return point
+
+def connect_areas(areas, area_lines, gap):
+    """Connector lines between the centerlines of walkway areas whose outlines are within gap
+
+    Closest pairs are joined first and each pair of separate networks only once,
+    so every small gap in the source polygons gets one crossing.
+    """
+    tree = shapely.STRtree(areas)
+    left, right = tree.query(areas, predicate="dwithin", distance=gap)
+    pairs = sorted((shapely.distance(areas[i], areas[j]), i, j) for i, j in zip(left.tolist(), right.tolist()) if i < j)
+
+    root = list(range(len(areas)))
+    def find(node):
+        while root[node] != node:
+            root[node] = root[root[node]]
+            node = root[node]
+        return node
+
+    connectors = []
+    for _, i, j in pairs:
+        if find(i) == find(j):
+            continue
+        root[find(i)] = find(j)
+        start, end = shapely.get_coordinates(shapely.shortest_line(
+            shapely.multilinestrings(area_lines[i]), shapely.multilinestrings(area_lines[j])))
+        start = split_at(area_lines[i], shapely.Point(start))
+        end = split_at(area_lines[j], shapely.Point(end))
+        connectors.append(shapely.LineString([start, end]))
+    return connectors
+
+def extract_centerlines(gdf):
+    """Centerline LineStrings (same CRS as gdf) for a GeoDataFrame of walkway polygons"""
+    projected = gdf.to_crs(epsg=3857).geometry.values
+    # Ground metres to EPSG:3857 units at Calgary's latitude
+    unit = 1 / MERCATOR_SCALE
+
+    areas = []
+    area_lines = []
+    for area in merge_polygons(projected, JOIN_GAP * unit):
+        # Closing the gaps can leave slivers with no walkable width
+        if area.area < (SAMPLE_SPACING * unit) ** 2:
+            continue
+        edges = medial_axis(area, SAMPLE_SPACING * unit)
+        if len(edges) == 0:
+            continue
+        edges = prune_spurs(edges, SPUR_LENGTH * unit, area)
+        merged = shapely.line_merge(shapely.multilinestrings(edges))
+        areas.append(area)
+        area_lines.append(list(shapely.get_parts(shapely.simplify(merged, SIMPLIFY_TOLERANCE * unit))))
+
+    connectors = connect_areas(areas, area_lines, CONNECT_GAP * unit)
+    lines = [line for group in area_lines for line in group] + connectors
+    centerlines = gpd.GeoDataFrame(geometry=lines, crs="EPSG:3857")
+    return centerlines.to_crs(gdf.crs)
+
+def source_signature(source_path=MAP_SNAPSHOT):
+    """Identifies the source snapshot and extraction parameters a centerline snapshot was built from"""
+    stat = os.stat(source_path) if os.path.exists(source_path) else None
+    return json.dumps({
+        "version": CENTERLINE_VERSION,
+        "source": [stat.st_size, stat.st_mtime_ns] if stat else None,
+        "parameters": [JOIN_GAP, SAMPLE_SPACING, SPUR_LENGTH, SPUR_RATIO, CONNECT_GAP, SIMPLIFY_TOLERANCE],
+    }, sort_keys=True)
+
+def saved_signature(path):
+    """Signature stored in a centerline snapshot, or None for one written without it"""
+    with pa.memory_map(path) as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    signature = metadata.get(b"centerline_source")
+    return signature.decode() if signature else None
+
+def save_centerlines(centerlines, path, signature):
+    """Write a centerline snapshot with its source signature in the file's schema metadata"""
+    centerlines.to_feather(path)
+    table = feather.read_table(path)
+    table = table.replace_schema_metadata({**table.schema.metadata, b"centerline_source": signature.encode()})
+    feather.write_feather(table, path)
+
+def load_or_build(source=mapLocal, path=CENTERLINE_SNAPSHOT, source_path=MAP_SNAPSHOT):
+    """Cached centerlines, extracted again from source() when the snapshot is missing or stale"""
+    signature = source_signature(source_path)
+    if os.path.exists(path):
+        try:
+            stale = saved_signature(path) != signature
+        except (OSError, pa.ArrowInvalid):
+            stale = True
+        if not stale:
+            return gpd.read_feather(path)
+        print(f"{path} was built from other source data or settings; extracting again")
+
+    centerlines = extract_centerlines(source())
+    save_centerlines(centerlines, path, signature)
+    print(f"Extracted {len(centerlines)} walkway centerlines to {path}")
+    return centerlines
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the +15 walkway centerline snapshot")
+    parser.add_argument("--output", default=CENTERLINE_SNAPSHOT)
+    args = parser.parse_args()
+
+    polygons = mapLocal()
+    outlines = paths(polygons).to_crs(epsg=3857)
+    centerlines = extract_centerlines(polygons)
+    save_centerlines(centerlines, args.output, source_signature())
+
+    def segment_count(gdf):
+        return int(sum(len(shapely.get_coordinates(part)) - 1 for part in shapely.get_parts(gdf.geometry.values)))
+
+    print(f"Outlines: {segment_count(outlines)} segments, {outlines.length.sum() * MERCATOR_SCALE / 1000:.1f} km")
+    projected = centerlines.to_crs(epsg=3857)
+    print(f"Centerlines: {segment_count(projected)} segments, {projected.length.sum() * MERCATOR_SCALE / 1000:.1f} km")
+    print(f"Wrote {len(centerlines)} centerlines to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+MISSING_VALUE = "N/A"
+
+# Business attribute columns kept resident for labels and lookups
+BUSINESS_COLUMNS = ("tradename", "homeoccind", "jobstatusdesc", "licencetypes", "address")
+
+def smallest_int_dtype(size):
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+class EncodedColumn:
+    """Dictionary-encoded string column: one small integer code per row into a table of unique values"""
+    __slots__ = ("codes", "values")
+
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series.fillna(MISSING_VALUE).astype(str))
+        self.codes = codes.astype(smallest_int_dtype(len(uniques)))
+        self.values = list(uniques)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + sum(len(value) for value in self.values)
+
+class BusinessRecords:
+    """Array-backed business attributes; row i describes row i of the source frame"""
+    __slots__ = ("busid", "x", "y", "columns")
+
+    def __init__(self, business_df, xs, ys, columns=BUSINESS_COLUMNS):
+        busid_column = "getbusid" if "getbusid" in business_df.columns else "busid"
+        self.busid = pd.to_numeric(business_df[busid_column], errors="coerce").fillna(-1).to_numpy(np.int64)
+        self.x = np.asarray(xs, dtype=np.float64)
+        self.y = np.asarray(ys, dtype=np.float64)
+        self.columns = {
+            column: EncodedColumn(business_df[column])
+            for column in columns if column in business_df.columns
+        }
+
+    def __len__(self):
+        return len(self.busid)
+
+    def get(self, row, column, default=MISSING_VALUE):
+        encoded = self.columns.get(column)
+        return default if encoded is None else encoded[row]
+
+    def info(self, row):
+        """Attributes of one business as a dict, built on demand"""
+        info = {"busid": int(self.busid[row]), "x": float(self.x[row]), "y": float(self.y[row])}
+        for column, encoded in self.columns.items():
+            info[column] = encoded[row]
+        return info
+
+    @property
+    def nbytes(self):
+        return (self.busid.nbytes + self.x.nbytes + self.y.nbytes
+                + sum(encoded.nbytes for encoded in self.columns.values()))
+
+class LineGeometry:
+    """Line geometry as one flat coordinate array plus offsets where each line starts"""
+    __slots__ = ("coords", "offsets")
+
+    def __init__(self, coords, offsets):
+        self.coords = coords
+        self.offsets = offsets
+
+    @classmethod
+    def from_geometries(cls, geometries):
+        parts = shapely.get_parts(np.asarray(geometries))
+        parts = parts[shapely.get_type_id(parts) == 1]
+        coords, line_index = shapely.get_coordinates(parts, return_index=True)
+
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(line_index, minlength=len(parts)), out=offsets[1:])
+        return cls(coords, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, i):
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def lines(self):
+        for i in range(len(self)):
+            yield self.line(i)
+
+    def segments(self):
+        """Start and end coordinates of every consecutive vertex pair, across all lines"""
+        last = np.zeros(len(self.coords), dtype=bool)
+        last[self.offsets[1:] - 1] = True
+        starts = np.flatnonzero(~last)
+        return self.coords[starts], self.coords[starts + 1]
+
+    @property
+    def nbytes(self):
+        return self.coords.nbytes + self.offsets.nbytes
@@ -1,16 +1,34 @@
+import os
+import numpy as np
+import shapely
 import geopandas as gpd
 import pandas as pd
 
+MAP_SNAPSHOT = "plus15_calgary.feather"
+BUSINESS_SNAPSHOT = "calgary_businesses.feather"
+
 def mapSave():
     gdf = gpd.read_file("https://data.calgary.ca/resource/3u3x-hrc7.geojson")
-    gdf.to_feather("plus15_calgary.feather")
+    gdf.to_feather(MAP_SNAPSHOT)
 
 def mapData():
     gdf = gpd.read_file("https://data.calgary.ca/resource/3u3x-hrc7.geojson")
     return gdf
 
-def paths():
-    gdf = mapData()
+def mapLocal(path=MAP_SNAPSHOT):
+    gdf = gpd.read_feather(path)
+    return gdf
+
+def mapCached(path=MAP_SNAPSHOT):
+    """Snapshot kept current by refresh.py, or the live dataset if none has been saved yet"""
+    if os.path.exists(path):
+        return mapLocal(path)
+    print(f"No snapshot at {path}; downloading the +15 dataset (run app/refresh.py to keep one)")
+    return mapData()
+
+def paths(gdf=None):
+    if gdf is None:
+        gdf = mapData()
     lines = gdf.geometry.boundary
     lines_gdf = gpd.GeoDataFrame(geometry=lines, crs=gdf.crs)
     return lines_gdf
@@ -19,10 +37,39 @@ def businessSave():
     url = "https://data.calgary.ca/resource/vdjc-pybd.csv"
     df = pd.read_csv(url)
 
-    df.to_feather("calgary_businesses.feather")
+    df.to_feather(BUSINESS_SNAPSHOT)
 
 def businessData():
     url = "https://data.calgary.ca/resource/vdjc-pybd.csv"
     df = pd.read_csv(url)
 
-    return df
\ No newline at end of file
+    return df
+
+def businessLocal(path=BUSINESS_SNAPSHOT):
+    df = pd.read_feather(path)
+
+    return df
+
+def businessCached(path=BUSINESS_SNAPSHOT):
+    """Snapshot kept current by refresh.py, or the live dataset if none has been saved yet"""
+    if os.path.exists(path):
+        return businessLocal(path)
+    print(f"No snapshot at {path}; downloading the business dataset (run app/refresh.py to keep one)")
+    return businessData()
+
+def businessPoints(df):
+    """Business locations as EPSG:3857 x/y arrays, NaN where the point is missing or invalid"""
+    values = df["point"].to_numpy(dtype=object)
+    is_text = np.array([isinstance(v, str) for v in values], dtype=bool)
+
+    geoms = values.copy()
+    geoms[is_text] = shapely.from_wkt(values[is_text], on_invalid="ignore")
+    geoms[~is_text & pd.isna(values)] = None
+
+    lon = shapely.get_x(geoms)
+    lat = shapely.get_y(geoms)
+
+    x = lon * 20037508.34 / 180
+    y = np.log(np.tan((90 + lat) * np.pi / 360)) / (np.pi / 180)
+    y = y * 20037508.34 / 180
+    return x, y
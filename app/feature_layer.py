@@ -0,0 +1,143 @@
+import math
+import numpy as np
+
+# Half the width of the EPSG:3857 world, as used by slippy map tiles
+WORLD_EXTENT = 20037508.342789244
+
+# Buckets are z16 tiles (about 600 m across at Calgary's latitude)
+BUCKET_ZOOM = 16
+
+# Extra area kept materialized around the viewport, as a fraction of its size
+VIEW_MARGIN = 0.5
+
+# Items kept for reuse after their bucket leaves the view
+POOL_SIZE = 2000
+
+def bucket_size(zoom=BUCKET_ZOOM):
+    return 2 * WORLD_EXTENT / 2 ** zoom
+
+def bucket_keys(xs, ys, zoom=BUCKET_ZOOM):
+    """Slippy tile column and row containing each projected point"""
+    size = bucket_size(zoom)
+    tx = np.floor((np.asarray(xs) + WORLD_EXTENT) / size).astype(np.int64)
+    ty = np.floor((WORLD_EXTENT - np.asarray(ys)) / size).astype(np.int64)
+    return tx, ty
+
+class SpatialBuckets:
+    """Feature ids grouped by the bucket their anchor point falls in"""
+    def __init__(self, xs, ys, zoom=BUCKET_ZOOM):
+        self.zoom = zoom
+        valid = np.flatnonzero(np.isfinite(xs) & np.isfinite(ys))
+        tx, ty = bucket_keys(np.asarray(xs)[valid], np.asarray(ys)[valid], zoom)
+
+        # Sort ids by bucket so each bucket is one contiguous slice
+        order = np.lexsort((ty, tx))
+        self.ids = valid[order]
+        tx = tx[order]
+        ty = ty[order]
+
+        starts = np.flatnonzero(np.r_[True, (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])])
+        ends = np.r_[starts[1:], len(self.ids)]
+        self.slices = {(int(tx[s]), int(ty[s])): (int(s), int(e)) for s, e in zip(starts, ends)}
+
+    def __len__(self):
+        return len(self.slices)
+
+    def get(self, key):
+        start, end = self.slices[key]
+        return self.ids[start:end]
+
+    def keys_in(self, left, bottom, right, top):
+        """Non-empty buckets intersecting a projected rectangle"""
+        size = bucket_size(self.zoom)
+        x0 = math.floor((left + WORLD_EXTENT) / size)
+        x1 = math.floor((right + WORLD_EXTENT) / size)
+        y0 = math.floor((WORLD_EXTENT - top) / size)
+        y1 = math.floor((WORLD_EXTENT - bottom) / size)
+
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.slices):
+            return {key for key in self.slices if x0 <= key[0] <= x1 and y0 <= key[1] <= y1}
+        return {(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in self.slices}
+
+class ItemPool:
+    """Detached scene items kept for reuse instead of being reallocated"""
+    def __init__(self, factory, limit=POOL_SIZE):
+        self.factory = factory
+        self.limit = limit
+        self.items = []
+
+    def acquire(self):
+        return self.items.pop() if self.items else self.factory()
+
+    def release(self, item):
+        if len(self.items) < self.limit:
+            self.items.append(item)
+
+class FeatureLayer:
+    """Creates scene items only for buckets near the viewport, releasing them as the view moves on
+
+    Each named layer supplies create(ids) returning the items for one bucket
+    (already in the scene) and release(items) removing them again. extent is
+    how far a feature reaches beyond its anchor point, so buckets just
+    outside the viewport whose features overlap it are still materialized.
+    A layer's filter mask keeps features it excludes from being created at all.
+    """
+    def __init__(self, margin=VIEW_MARGIN):
+        self.margin = margin
+        self.layers = {}
+
+    def add_layer(self, name, xs, ys, create, release, extent=0.0, zoom=BUCKET_ZOOM):
+        self.layers[name] = {
+            "buckets": SpatialBuckets(xs, ys, zoom),
+            "create": create,
+            "release": release,
+            "extent": extent,
+            "mask": None,
+            "live": {},
+        }
+
+    def bucket_ids(self, layer, key):
+        ids = layer["buckets"].get(key)
+        if layer["mask"] is not None:
+            ids = ids[layer["mask"][ids]]
+        return ids
+
+    def set_filter(self, name, mask):
+        """Materialize only the ids set in a boolean mask (None for all), rebuilding the live buckets once"""
+        layer = self.layers[name]
+        layer["mask"] = mask
+        live = layer["live"]
+        for key in list(live):
+            layer["release"](live[key])
+            live[key] = layer["create"](self.bucket_ids(layer, key))
+
+    def live_items(self, name):
+        for items in self.layers[name]["live"].values():
+            yield from items
+
+    def update(self, rect):
+        """Materialize buckets intersecting rect plus margin, release the rest"""
+        pad_x = rect.width() * self.margin
+        pad_y = rect.height() * self.margin
+        left, right = rect.left() - pad_x, rect.right() + pad_x
+        bottom, top = min(rect.top(), rect.bottom()) - pad_y, max(rect.top(), rect.bottom()) + pad_y
+
+        for layer in self.layers.values():
+            extent = layer["extent"]
+            wanted = layer["buckets"].keys_in(left - extent, bottom - extent, right + extent, top + extent)
+            live = layer["live"]
+
+            for key in [key for key in live if key not in wanted]:
+                layer["release"](live.pop(key))
+            for key in wanted:
+                if key not in live:
+                    live[key] = layer["create"](self.bucket_ids(layer, key))
+
+    def clear(self):
+        for layer in self.layers.values():
+            for items in layer["live"].values():
+                layer["release"](items)
+            layer["live"].clear()
+
+    def item_count(self):
+        return sum(len(items) for layer in self.layers.values() for items in layer["live"].values())
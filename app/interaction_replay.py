@@ -0,0 +1,176 @@
+"""Record map interaction sessions and replay them headlessly for latency testing.
+
+Record a session with the normal window (saved when the window closes):
+    python app/interaction_replay.py record session.jsonl
+
+Replay it offscreen and print per-event latency percentiles:
+    python app/interaction_replay.py replay session.jsonl --repeat 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from PySide6.QtWidgets import QApplication
+from PySide6.QtGui import QWheelEvent, QMouseEvent, QTransform
+from PySide6.QtCore import QObject, QEvent, QPoint, QPointF, Qt
+
+from data import businessLocal
+from centerlines import load_or_build
+from timing import LatencyStats
+
+RECORDED_EVENTS = {
+    QEvent.Wheel: "wheel",
+    QEvent.MouseButtonPress: "press",
+    QEvent.MouseMove: "move",
+    QEvent.MouseButtonRelease: "release",
+}
+
+REPLAYED_EVENTS = {
+    "press": QEvent.MouseButtonPress,
+    "move": QEvent.MouseMove,
+    "release": QEvent.MouseButtonRelease,
+}
+
+class InteractionRecorder(QObject):
+    """Captures wheel and mouse events reaching the map viewport"""
+    def __init__(self, window, parent=None):
+        super().__init__(parent)
+        self.window = window
+        self.view = window.view
+        self.events = []
+        self.header = self.capture_view_state()
+        self.start_time = time.perf_counter()
+        self.view.viewport().installEventFilter(self)
+
+    def capture_view_state(self):
+        """Window size and view transform needed to start a replay from the same state"""
+        transform = self.view.transform()
+        center = self.view.mapToScene(self.view.viewport().rect().center())
+        return {
+            "window": [self.window.width(), self.window.height()],
+            "transform": [transform.m11(), transform.m12(), transform.m13(),
+                          transform.m21(), transform.m22(), transform.m23(),
+                          transform.m31(), transform.m32(), transform.m33()],
+            "center": [center.x(), center.y()],
+            "current_zoom": self.view.current_zoom,
+        }
+
+    def eventFilter(self, obj, event):
+        kind = RECORDED_EVENTS.get(event.type())
+        if kind is not None:
+            pos = event.position()
+            record = {
+                "t": round(time.perf_counter() - self.start_time, 6),
+                "type": kind,
+                "x": pos.x(),
+                "y": pos.y(),
+            }
+            if kind == "wheel":
+                record["delta"] = event.angleDelta().y()
+            else:
+                record["button"] = event.button().value
+                record["buttons"] = event.buttons().value
+            self.events.append(record)
+        return False
+
+    def save(self, path):
+        header = dict(self.header, events=len(self.events))
+        with open(path, "w") as f:
+            f.write(json.dumps(header) + "\n")
+            for record in self.events:
+                f.write(json.dumps(record) + "\n")
+        print(f"Recorded {len(self.events)} events to {path}")
+
+def load_session(path):
+    with open(path) as f:
+        header = json.loads(f.readline())
+        events = [json.loads(line) for line in f if line.strip()]
+    return header, events
+
+def build_event(record):
+    pos = QPointF(record["x"], record["y"])
+    if record["type"] == "wheel":
+        return QWheelEvent(pos, pos, QPoint(), QPoint(0, record["delta"]),
+                           Qt.NoButton, Qt.NoModifier, Qt.NoScrollPhase, False)
+    return QMouseEvent(REPLAYED_EVENTS[record["type"]], pos, pos,
+                       Qt.MouseButton(record["button"]), Qt.MouseButton(record["buttons"]),
+                       Qt.NoModifier)
+
+def restore_view_state(window, header):
+    """Put the window and view back in the state the recording started from"""
+    window.resize(*header["window"])
+    QApplication.processEvents()
+
+    view = window.view
+    view.setTransform(QTransform(*header["transform"]))
+    view.centerOn(QPointF(*header["center"]))
+    view.current_zoom = header["current_zoom"]
+    QApplication.processEvents()
+
+def replay_session(window, header, events, stats):
+    """Send every recorded event to the viewport and time it until the event queue drains"""
+    restore_view_state(window, header)
+    viewport = window.view.viewport()
+
+    for record in events:
+        event = build_event(record)
+        start = time.perf_counter()
+        QApplication.sendEvent(viewport, event)
+        QApplication.processEvents()
+        stats.add(record["type"], (time.perf_counter() - start) * 1000)
+
+def create_window():
+    from main import Plus15Map
+
+    gdf_projected = load_or_build().to_crs(epsg=3857)
+    business_df = businessLocal()
+    return Plus15Map(gdf_projected, business_df)
+
+def record(output):
+    app = QApplication(sys.argv)
+    window = create_window()
+    window.show()
+    QApplication.processEvents()
+
+    recorder = InteractionRecorder(window)
+    app.aboutToQuit.connect(lambda: recorder.save(output))
+    sys.exit(app.exec())
+
+def replay(session, repeat):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication(sys.argv)
+    window = create_window()
+    window.show()
+    QApplication.processEvents()
+
+    header, events = load_session(session)
+    print(f"Replaying {len(events)} events from {session} ({repeat}x)")
+
+    stats = LatencyStats()
+    for _ in range(repeat):
+        replay_session(window, header, events, stats)
+
+    stats.report()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay +15 map interaction sessions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="open the map and record interactions")
+    record_parser.add_argument("output")
+
+    replay_parser = subparsers.add_parser("replay", help="replay a session offscreen and report latency")
+    replay_parser.add_argument("session")
+    replay_parser.add_argument("--repeat", type=int, default=1)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.output)
+    else:
+        replay(args.session, args.repeat)
+
+if __name__ == "__main__":
+    main()
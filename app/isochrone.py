@@ -0,0 +1,101 @@
+import numpy as np
+
+from network import WALKING_SPEED, MERCATOR_SCALE
+
+DEFAULT_THRESHOLDS = (2, 5, 10)  # minutes
+
+# Businesses further than this from the network (ground metres) are not reachable through it
+MAX_ACCESS_DISTANCE = 40
+
+class Isochrone:
+    """Walking reachability from one start position for several time thresholds.
+
+    A single search bounded by the largest threshold is run; every smaller
+    threshold is read off the same distance array.
+    """
+    def __init__(self, network, start, thresholds=DEFAULT_THRESHOLDS):
+        self.network = network
+        self.start = start
+        self.thresholds = tuple(sorted(thresholds))
+        self.max_cost = self.cost(self.thresholds[-1])
+
+        dist, _ = network.search(network.position_sources(start), max_cost=self.max_cost)
+        self.dist = np.asarray(dist)
+
+    @staticmethod
+    def cost(minutes):
+        """Walking distance in ground metres covered in the given number of minutes"""
+        return minutes * 60 * WALKING_SPEED
+
+    def segment_pieces(self, minutes):
+        """Reachable parts of every segment as ((x1, y1), (x2, y2)) EPSG:3857 pieces"""
+        network = self.network
+        cost = self.cost(minutes)
+
+        length = network.seg_length
+        du = self.dist[network.seg_u]
+        dv = self.dist[network.seg_v]
+
+        # Distance walkable into each segment from either end
+        from_u = np.clip(cost - du, 0, length)
+        from_v = np.clip(cost - dv, 0, length)
+        whole = from_u + from_v >= length
+
+        # The start segment is reachable around the start point itself, not just from its ends
+        start = self.start.segment
+        start_offset = self.start.fraction * length[start]
+        whole[start] = False
+        from_u[start] = from_v[start] = 0
+
+        ux = network.node_x[network.seg_u]
+        uy = network.node_y[network.seg_u]
+        vx = network.node_x[network.seg_v]
+        vy = network.node_y[network.seg_v]
+        safe_length = np.where(length > 0, length, 1)
+
+        pieces = []
+        for s in np.flatnonzero(whole & (np.isfinite(du) | np.isfinite(dv))):
+            pieces.append(((ux[s], uy[s]), (vx[s], vy[s])))
+
+        for s in np.flatnonzero(~whole & (from_u > 0)):
+            f = from_u[s] / safe_length[s]
+            pieces.append(((ux[s], uy[s]), (ux[s] + f * (vx[s] - ux[s]), uy[s] + f * (vy[s] - uy[s]))))
+
+        for s in np.flatnonzero(~whole & (from_v > 0)):
+            f = from_v[s] / safe_length[s]
+            pieces.append(((vx[s], vy[s]), (vx[s] + f * (ux[s] - vx[s]), vy[s] + f * (uy[s] - vy[s]))))
+
+        lo = max(0.0, start_offset - cost) / safe_length[start]
+        hi = min(length[start], start_offset + cost) / safe_length[start]
+        pieces.append((
+            (ux[start] + lo * (vx[start] - ux[start]), uy[start] + lo * (vy[start] - uy[start])),
+            (ux[start] + hi * (vx[start] - ux[start]), uy[start] + hi * (vy[start] - uy[start])),
+        ))
+
+        return pieces
+
+    def business_costs(self, access):
+        """Walking distance to each business from its (segments, fractions, distances) access, including the walk off the network"""
+        segments, fractions, distances = access
+        network = self.network
+
+        valid = segments >= 0
+        safe_segments = np.where(valid, segments, 0)
+        length = network.seg_length[safe_segments]
+        via_u = self.dist[network.seg_u[safe_segments]] + fractions * length
+        via_v = self.dist[network.seg_v[safe_segments]] + (1 - fractions) * length
+
+        costs = np.minimum(via_u, via_v)
+
+        on_start = segments == self.start.segment
+        costs[on_start] = np.abs(fractions[on_start] - self.start.fraction) * length[on_start]
+
+        # Walk from the network to the business itself
+        access_distance = distances * MERCATOR_SCALE
+        costs += access_distance
+        costs[~valid | (access_distance > MAX_ACCESS_DISTANCE)] = np.inf
+        return costs
+
+    def reachable_businesses(self, access, minutes):
+        """Indices of the businesses reachable within the given number of minutes"""
+        return np.flatnonzero(self.business_costs(access) <= self.cost(minutes))
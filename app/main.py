@@ -1,25 +1,40 @@
+import os
 import sys
 import math
+import numpy as np
 from PySide6.QtWidgets import (QApplication, QMainWindow, QGraphicsView, QGraphicsScene, 
-                               QGraphicsLineItem, QGraphicsEllipseItem, QWidget, QVBoxLayout, QHBoxLayout, 
+                               QGraphicsEllipseItem, QWidget, QVBoxLayout, QHBoxLayout, 
                                QPushButton, QSplitter, QLabel, QFrame, QMessageBox, QCheckBox, QScrollArea,
-                               QGraphicsTextItem)
-from PySide6.QtGui import QPen, QPainter, QIcon, QFont, QBrush, QColor
-from PySide6.QtCore import Qt, QEvent, QSize, QRectF, QTimer, QPointF
+                               QGraphicsTextItem, QGraphicsPathItem, QLineEdit, QListWidget,
+                               QListWidgetItem, QGraphicsItem)
+from PySide6.QtGui import QPen, QPainter, QIcon, QFont, QBrush, QColor, QPainterPath
+from PySide6.QtCore import Qt, QSize, QRectF, QTimer, QPointF, Signal
 from PySide6.QtPositioning import QGeoPositionInfoSource, QGeoPositionInfo
 
-from shapely.geometry import LineString, MultiLineString, Point
-from data import paths, businessData
-from tile_loader import TileLayer
+from data import mapCached, businessCached, businessPoints
+from centerlines import load_or_build
+from tile_loader import TileLayer, BASEMAP_TILES
+from tile_prefetch import TilePrefetcher
+from network import Plus15Network, RouteTree
+from map_matching import MapMatcher
+from search_index import BusinessSearchIndex
+from isochrone import Isochrone, DEFAULT_THRESHOLDS
+from business_filters import BusinessFilterIndex, FILTER_COLUMNS
+from compact_store import LineGeometry, BusinessRecords
+from overlay_tiles import OVERLAY_TILES_DIR, OVERLAY_LAYERS
+from feature_layer import FeatureLayer, ItemPool
+from network_grid import NetworkGrid
 
 class BusinessPointItem(QGraphicsEllipseItem):
     """Custom graphics item for business points with hover effects"""
-    def __init__(self, x, y, business_info, radius=4):
-        super().__init__(x - radius, y - radius, radius * 2, radius * 2)
-        self.business_info = business_info
-        self.radius = radius
-        self.center_x = x
-        self.center_y = y
+    radius = 4
+    
+    def __init__(self, records, row):
+        super().__init__()
+        
+        # Attributes live in the shared records; the item only keeps its row
+        self.records = records
+        self.set_row(row)
         
         # Default appearance
         self.setPen(QPen(Qt.darkBlue, 1))
@@ -31,6 +46,13 @@ class BusinessPointItem(QGraphicsEllipseItem):
         # Text item for business name (initially hidden)
         self.text_item = None
         
+    def set_row(self, row):
+        """Point this item at another business, so pooled items can be reused"""
+        self.row = row
+        x = self.records.x[row]
+        y = self.records.y[row]
+        self.setRect(x - self.radius, y - self.radius, self.radius * 2, self.radius * 2)
+        
     def hoverEnterEvent(self, event):
         """Show business name and highlight on hover"""
         # Enlarge and change color
@@ -39,15 +61,16 @@ class BusinessPointItem(QGraphicsEllipseItem):
         
         # Create text item if it doesn't exist
         if not self.text_item:
-            self.text_item = QGraphicsTextItem(self.business_info.get('tradename', 'Unknown Business'))
+            self.text_item = QGraphicsTextItem(self.records.get(self.row, 'tradename', 'Unknown Business'))
             self.text_item.setFont(QFont("Arial", 8))
             self.text_item.setDefaultTextColor(Qt.black)
             
             # Position text above the point
             text_rect = self.text_item.boundingRect()
+            center = self.rect().center()
             self.text_item.setPos(
-                self.center_x - text_rect.width() / 2,
-                self.center_y - self.radius - text_rect.height() - 5
+                center.x() - text_rect.width() / 2,
+                center.y() - self.radius - text_rect.height() - 5
             )
             
             # Add background rectangle for better readability
@@ -70,20 +93,50 @@ class BusinessPointItem(QGraphicsEllipseItem):
     
     def hoverLeaveEvent(self, event):
         """Hide business name and return to normal appearance"""
+        self.clear_hover()
+        
+        super().hoverLeaveEvent(event)
+    
+    def clear_hover(self):
+        """Undo the hover state, also needed when the item leaves the scene while hovered"""
         # Return to normal appearance
         self.setPen(QPen(Qt.darkBlue, 1))
         self.setBrush(QBrush(Qt.blue))
         
         # Remove text item
         if self.text_item:
-            self.scene().removeItem(self.text_item)
-            self.scene().removeItem(self.bg_rect)
+            self.text_item.scene().removeItem(self.text_item)
+            self.bg_rect.scene().removeItem(self.bg_rect)
             self.text_item = None
             self.bg_rect = None
-        
-        super().hoverLeaveEvent(event)
+
+class IsochroneMarker(QGraphicsEllipseItem):
+    """Draggable start marker that recomputes the isochrone as it moves"""
+    def __init__(self, on_moved, radius=8):
+        super().__init__(-radius, -radius, radius * 2, radius * 2)
+        self.on_moved = on_moved
+        
+        self.setPen(QPen(Qt.white, 2))
+        self.setBrush(QBrush(QColor("#2e7d32")))
+        self.setZValue(11)
+        
+        # Constant on-screen size, draggable, and notify on every move
+        self.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        self.setFlag(QGraphicsItem.ItemIsMovable)
+        self.setFlag(QGraphicsItem.ItemSendsGeometryChanges)
+        self.setCursor(Qt.OpenHandCursor)
+        
+    def itemChange(self, change, value):
+        if change == QGraphicsItem.ItemPositionHasChanged:
+            self.on_moved(value.x(), value.y())
+        return super().itemChange(change, value)
 
 class ZoomableGraphicsView(QGraphicsView):
+    # Emitted whenever the visible scene area may have moved or been resized
+    view_changed = Signal()
+    # Business layer visibility or filter mask changed
+    business_filter_changed = Signal()
+    
     def __init__(self):
         super().__init__()
         self.scale(1, -1)
@@ -101,8 +154,10 @@ class ZoomableGraphicsView(QGraphicsView):
         self.user_location_item = None
         self.user_accuracy_item = None
         
-        # Store business items for toggling visibility
-        self.business_items = []
+        # Business items currently in the scene, by record row
+        self.business_items = {}
+        self.business_layer_visible = True
+        self.business_filter_mask = None
 
     def wheelEvent(self, event):
         zoom_in_factor = 1.25
@@ -128,6 +183,18 @@ class ZoomableGraphicsView(QGraphicsView):
         self.translate(delta.x(), delta.y())
         
         self.constrain_to_bounds()
+        self.view_changed.emit()
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.view_changed.emit()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.view_changed.emit()
+
+    def visible_scene_rect(self):
+        return self.mapToScene(self.viewport().rect()).boundingRect()
 
     def mousePressEvent(self, event):
         super().mousePressEvent(event)
@@ -176,36 +243,43 @@ class ZoomableGraphicsView(QGraphicsView):
         
         self.min_zoom_level = self.current_zoom = 1.0
 
-    def update_user_location(self, x, y, accuracy=None):
-        """Update user location on the map"""
-        if self.user_location_item:
-            self.scene().removeItem(self.user_location_item)
-        if self.user_accuracy_item:
-            self.scene().removeItem(self.user_accuracy_item)
-        
-        if accuracy is not None:
-            radius = accuracy
+    def update_user_location(self, x, y, accuracy=None, accuracy_center=None):
+        """Update user location on the map, reusing the existing location items"""
+        if self.user_location_item is None:
+            location_pen = QPen(Qt.white)
+            location_pen.setWidth(2)
+            location_brush = QBrush(Qt.blue)
+
+            self.user_location_item = QGraphicsEllipseItem()
+            self.user_location_item.setPen(location_pen)
+            self.user_location_item.setBrush(location_brush)
+            self.user_location_item.setZValue(10)
+            self.scene().addItem(self.user_location_item)
+
             accuracy_pen = QPen(Qt.blue)
             accuracy_pen.setWidth(1)
             accuracy_pen.setStyle(Qt.DashLine)
-            accuracy_brush = QBrush(Qt.blue)
-            accuracy_brush.setStyle(Qt.NoBrush)
-            
-            self.user_accuracy_item = QGraphicsEllipseItem(
-                x - radius, y - radius, radius * 2, radius * 2
-            )
+
+            self.user_accuracy_item = QGraphicsEllipseItem()
             self.user_accuracy_item.setPen(accuracy_pen)
-            self.user_accuracy_item.setBrush(accuracy_brush)
+            self.user_accuracy_item.setBrush(Qt.NoBrush)
+            self.user_accuracy_item.setZValue(9)
             self.scene().addItem(self.user_accuracy_item)
-        
-        location_pen = QPen(Qt.white)
-        location_pen.setWidth(2)
-        location_brush = QBrush(Qt.blue)
-        
-        self.user_location_item = QGraphicsEllipseItem(x - 5, y - 5, 10, 10)
-        self.user_location_item.setPen(location_pen)
-        self.user_location_item.setBrush(location_brush)
-        self.scene().addItem(self.user_location_item)
+
+        self.user_location_item.setRect(x - 5, y - 5, 10, 10)
+        self.user_location_item.setVisible(True)
+
+        if accuracy is not None:
+            cx, cy = accuracy_center if accuracy_center is not None else (x, y)
+            radius = accuracy
+            self.user_accuracy_item.setRect(cx - radius, cy - radius, radius * 2, radius * 2)
+        self.user_accuracy_item.setVisible(accuracy is not None)
+
+    def hide_user_location(self):
+        """Hide the location items without removing them from the scene"""
+        if self.user_location_item is not None:
+            self.user_location_item.setVisible(False)
+            self.user_accuracy_item.setVisible(False)
 
     def lat_lon_to_web_mercator(self, lat, lon):
         """Convert latitude/longitude to Web Mercator (EPSG:3857)"""
@@ -216,8 +290,23 @@ class ZoomableGraphicsView(QGraphicsView):
 
     def toggle_business_visibility(self, visible):
         """Toggle visibility of business points"""
-        for item in self.business_items:
-            item.setVisible(visible)
+        self.business_layer_visible = visible
+        self.refresh_business_visibility()
+
+    def set_business_filter(self, mask):
+        """Show only the business rows set in mask (None shows every row)"""
+        self.business_filter_mask = mask
+        self.refresh_business_visibility()
+
+    def business_mask(self, count):
+        """Rows to materialize given layer visibility and the filter mask; None for every row"""
+        if not self.business_layer_visible:
+            return np.zeros(count, dtype=bool)
+        return self.business_filter_mask
+
+    def refresh_business_visibility(self):
+        """Hidden and filtered-out businesses are never materialized, so the feature layer rebuilds its buckets"""
+        self.business_filter_changed.emit()
 
 class PlanningPanel(QWidget):
     def __init__(self, parent=None):
@@ -270,8 +359,73 @@ class PlanningPanel(QWidget):
             }
         """)
         
+        # Business search
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search businesses...")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.update_search_results)
+        
+        self.search_results = QListWidget()
+        self.search_results.setMaximumHeight(150)
+        self.search_results.itemClicked.connect(self.focus_search_result)
+        self.search_results.currentItemChanged.connect(self.update_route_button)
+        
+        self.route_button = QPushButton("Route Here")
+        self.route_button.setEnabled(False)
+        self.route_button.clicked.connect(self.route_to_search_result)
+        
+        self.route_status = QLabel()
+        self.route_status.setWordWrap(True)
+        self.route_status.hide()
+        
+        self.clear_route_button = QPushButton("Clear Route")
+        self.clear_route_button.setEnabled(False)
+        self.clear_route_button.clicked.connect(self.clear_route)
+        
+        # Walking isochrones
+        thresholds = "/".join(str(minutes) for minutes in DEFAULT_THRESHOLDS)
+        self.isochrone_checkbox = QCheckBox(f"Show Walking Reach ({thresholds} min)")
+        self.isochrone_checkbox.toggled.connect(self.toggle_isochrone)
+        
         content_layout = QVBoxLayout()
         content_layout.addWidget(self.business_checkbox)
+        content_layout.addWidget(self.isochrone_checkbox)
+        
+        # Business attribute filters, one checkable list per column
+        self.filter_lists = {}
+        filters = self.parent_window.business_filters if self.parent_window else None
+        if self.parent_window and self.parent_window.overlay_tiles:
+            # Overlay tiles bake every business into the raster, so there is nothing to filter or hover
+            filters = None
+            overlay_label = QLabel("Business filters and hover labels are unavailable with --overlay-tiles")
+            overlay_label.setWordWrap(True)
+            overlay_label.setStyleSheet("color: #6c757d;")
+            content_layout.addWidget(overlay_label)
+        for column, title in FILTER_COLUMNS.items():
+            if filters is None or column not in filters.bitmaps:
+                continue
+            categories = filters.categories(column)
+            if len(categories) < 2:
+                continue
+            
+            filter_list = QListWidget()
+            filter_list.setMaximumHeight(100)
+            for category, count in categories.items():
+                item = QListWidgetItem(f"{category} ({count})")
+                item.setData(Qt.UserRole, category)
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Checked)
+                filter_list.addItem(item)
+            filter_list.itemChanged.connect(lambda item, column=column: self.update_business_filter(column))
+            
+            content_layout.addWidget(QLabel(title))
+            content_layout.addWidget(filter_list)
+            self.filter_lists[column] = filter_list
+        content_layout.addWidget(self.search_box)
+        content_layout.addWidget(self.search_results)
+        content_layout.addWidget(self.route_button)
+        content_layout.addWidget(self.route_status)
+        content_layout.addWidget(self.clear_route_button)
         
         placeholder_label = QLabel("Additional planning tools will go here...")
         placeholder_label.setAlignment(Qt.AlignCenter)
@@ -299,28 +453,121 @@ class PlanningPanel(QWidget):
             # Update the floating button appearance
             self.parent_window.toggle_business_visibility()
 
+    def update_business_filter(self, column):
+        """Restrict a filter column to its checked categories"""
+        filter_list = self.filter_lists[column]
+        checked = [
+            filter_list.item(i).data(Qt.UserRole)
+            for i in range(filter_list.count())
+            if filter_list.item(i).checkState() == Qt.Checked
+        ]
+        
+        filters = self.parent_window.business_filters
+        filters.set_filter(column, None if len(checked) == filter_list.count() else checked)
+        self.parent_window.view.set_business_filter(filters.mask())
+
+    def toggle_isochrone(self, checked):
+        if not self.parent_window:
+            return
+        if checked:
+            self.parent_window.show_isochrone()
+        else:
+            self.parent_window.hide_isochrone()
+
+    def update_search_results(self, text):
+        """Refresh the result list on every keystroke"""
+        self.search_results.clear()
+        if not self.parent_window:
+            return
+        
+        for result in self.parent_window.search_index.search(text):
+            item = QListWidgetItem(result['name'])
+            item.setData(Qt.UserRole, result)
+            self.search_results.addItem(item)
+
+    def update_route_button(self, current, previous=None):
+        self.route_button.setEnabled(current is not None)
+
+    def focus_search_result(self, item):
+        result = item.data(Qt.UserRole)
+        self.parent_window.focus_on(result['x'], result['y'])
+
+    def route_to_search_result(self):
+        item = self.search_results.currentItem()
+        if item is None:
+            return
+        result = item.data(Qt.UserRole)
+        self.parent_window.focus_on(result['x'], result['y'])
+        self.parent_window.set_route_destination(result['x'], result['y'])
+
+    def clear_route(self):
+        if self.parent_window:
+            self.parent_window.clear_route()
+
+    def show_route_status(self, text, active):
+        """Route progress under the route buttons; empty text hides it"""
+        self.route_status.setText(text)
+        self.route_status.setVisible(bool(text))
+        self.clear_route_button.setEnabled(active)
+
     def close_planning_mode(self):
         if self.parent_window:
             self.parent_window.toggle_planning_mode()
 
 class Plus15Map(QMainWindow):
-    def __init__(self, gdf, business_df):
+    def __init__(self, gdf, business_df, overlay_tiles=False, tiles_root=BASEMAP_TILES):
         super().__init__()
         self.setWindowTitle("Calgary +15 Map")
         self.resize(400, 750)
         
         self.planning_mode = False
-        self.gdf = gdf
-        self.business_df = business_df
+        
+        # Draw the network and businesses from pre-rendered tiles instead of scene items
+        self.tiles_root = tiles_root
+        self.overlay_tiles = overlay_tiles and os.path.isdir(OVERLAY_TILES_DIR)
+        self.feature_layer = None
+        if overlay_tiles and not self.overlay_tiles:
+            print(f"No overlay tiles in {OVERLAY_TILES_DIR}; drawing vector layers")
         
         # Location services
         self.location_source = None
         self.location_enabled = False
+        self.current_position = None
+        # The last fix was too far from every segment to snap
+        self.off_network = False
+
+        # Routing
+        self.route_tree = None
+        self.route_item = None
+        
+        # Build every derived structure up front; the source frames are not kept
+        self.prepare_data(gdf, business_df)
+        
+        # Isochrones
+        self.business_access = None
+        self.isochrone = None
+        self.isochrone_marker = None
+        self.isochrone_follows_location = False
+        self.isochrone_items = {}
+        self.isochrone_business_item = None
         
         self.init_ui()
         self.setup_map()
         self.setup_location_services()
 
+    def prepare_data(self, gdf, business_df):
+        """Convert the source frames into compact resident structures"""
+        self.network_geometry = LineGeometry.from_geometries(gdf.geometry.values)
+        self.network = Plus15Network.from_geometry(self.network_geometry)
+        
+        business_x, business_y = businessPoints(business_df)
+        self.business_records = BusinessRecords(business_df, business_x, business_y)
+        self.business_filters = BusinessFilterIndex(business_df)
+        self.search_index = BusinessSearchIndex.load_or_build(business_df)
+        
+        print(f"Resident datasets: {self.network_geometry.nbytes / 1024:.0f} KiB network geometry, "
+              f"{self.business_records.nbytes / 1024:.0f} KiB business records")
+
     def init_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -439,6 +686,7 @@ class Plus15Map(QMainWindow):
         """Toggle business points visibility from the floating button"""
         self.business_visible = not self.business_visible
         self.view.toggle_business_visibility(self.business_visible)
+        self.tile_layer.set_overlay_visible("businesses", self.business_visible)
         
         # Update button appearance based on state
         if self.business_visible:
@@ -499,46 +747,7 @@ class Plus15Map(QMainWindow):
                 }
             """)
         else:
-            self.planning_panel.hide()
-            self.plus_button.setText("+")
-            self.plus_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #007bff;
-                    color: white;
-                    border: none;
-                    border-radius: 25px;
-                    font-size: 24px;
-                    font-weight: bold;
-                }
-                QPushButton:hover {
-                    background-color: #0056b3;
-                }
-                QPushButton:pressed {
-                    background-color: #004085;
-                }
-            """)
-        self.planning_mode = not self.planning_mode
-        
-        if self.planning_mode:
-            self.planning_panel.show()
-            self.plus_button.setText("−")
-            self.plus_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #dc3545;
-                    color: white;
-                    border: none;
-                    border-radius: 25px;
-                    font-size: 24px;
-                    font-weight: bold;
-                }
-                QPushButton:hover {
-                    background-color: #c82333;
-                }
-                QPushButton:pressed {
-                    background-color: #bd2130;
-                }
-            """)
-        else:
+            self.clear_route()
             self.planning_panel.hide()
             self.plus_button.setText("+")
             self.plus_button.setStyleSheet("""
@@ -559,19 +768,39 @@ class Plus15Map(QMainWindow):
             """)
 
     def setup_map(self):
-        self.tile_layer = TileLayer(self.scene, tiles_root="tiles_cartodb_positron")
+        overlay_roots = None
+        if self.overlay_tiles:
+            overlay_roots = {layer: os.path.join(OVERLAY_TILES_DIR, layer) for layer in OVERLAY_LAYERS}
+        self.tile_layer = TileLayer(self.scene, tiles_root=self.tiles_root, overlay_roots=overlay_roots)
+        self.tile_prefetcher = TilePrefetcher(self.tile_layer, self)
         
         self.setup_scene_bounds()
-        self.draw_lines(self.gdf)
-        self.draw_business_points(self.business_df)
+        self.setup_network_grid()
+        if not self.overlay_tiles:
+            self.setup_feature_layer()
 
         self.view.set_initial_view()
         
         self.update_tiles()
+        self.update_features()
 
         self.view.setRenderHint(QPainter.Antialiasing)
         self.view.setDragMode(QGraphicsView.ScrollHandDrag)
-        self.view.viewport().installEventFilter(self)
+        
+        self.view_timer = QTimer(self)
+        self.view_timer.setSingleShot(True)
+        self.view_timer.timeout.connect(self.on_view_changed)
+        # Coalesce the several view changes of one zoom or drag step into one update
+        self.view.view_changed.connect(self.view_timer.start)
+
+    def setup_network_grid(self):
+        """Lookup grid over the map bounds so taps and fixes snap to the network in constant time"""
+        bounds = self.view.bounds
+        # view.bounds is built from its minimum corner with positive sizes, so Qt's top() is the
+        # smaller northing and bottom() the larger; NetworkGrid takes (minx, miny, maxx, maxy)
+        minx, miny, maxx, maxy = bounds.left(), bounds.top(), bounds.right(), bounds.bottom()
+        self.network_grid = NetworkGrid.load_or_build(self.network, (minx, miny, maxx, maxy))
+        self.map_matcher = MapMatcher(self.network, self.network_grid.locate)
 
     def setup_scene_bounds(self):
         """Set up the scene rectangle to match Calgary bounds"""
@@ -588,76 +817,232 @@ class Plus15Map(QMainWindow):
         print(f"Scene Rect (EPSG:3857 meters): {self.scene.sceneRect()}")
         print(f"Calgary bounds: Left={bounds.left()}, Right={bounds.right()}, Top={bounds.top()}, Bottom={bounds.bottom()}")
 
-    def draw_lines(self, gdf):
+    def setup_feature_layer(self):
+        """Network and business items are created per bucket, only near the viewport"""
+        self.feature_layer = FeatureLayer()
+        
+        # Network segments are anchored at their midpoints
+        self.segment_starts, self.segment_ends = self.network_geometry.segments()
+        midpoints = (self.segment_starts + self.segment_ends) / 2
+        reach = np.abs(self.segment_ends - self.segment_starts).max() / 2 + 3
+        self.network_pool = ItemPool(self.new_network_item)
+        self.feature_layer.add_layer("network", midpoints[:, 0], midpoints[:, 1],
+                                     self.create_network_bucket, self.release_network_bucket, extent=reach)
+        
+        records = self.business_records
+        self.business_pool = ItemPool(lambda: BusinessPointItem(records, 0))
+        self.feature_layer.add_layer("businesses", records.x, records.y,
+                                     self.create_business_bucket, self.release_business_bucket,
+                                     extent=BusinessPointItem.radius)
+        
+        self.view.business_filter_changed.connect(self.apply_business_filter)
+        
+        print(f"Bucketed {len(self.segment_starts)} network segments and {len(records)} business points")
+
+    def apply_business_filter(self):
+        self.feature_layer.set_filter("businesses", self.view.business_mask(len(self.business_records)))
+
+    def update_features(self):
+        if self.feature_layer is None:
+            return
+        self.feature_layer.update(self.view.visible_scene_rect())
+
+    def new_network_item(self):
         pen = QPen(Qt.red)
         pen.setWidth(3)
         pen.setCapStyle(Qt.RoundCap)
+        
+        item = QGraphicsPathItem()
+        item.setPen(pen)
+        return item
 
-        for geom in gdf.geometry:
-            if isinstance(geom, LineString):
-                lines = [geom]
-            elif isinstance(geom, MultiLineString):
-                lines = geom.geoms
-            else:
-                continue
+    def create_network_bucket(self, segments):
+        """One path item draws every network segment in a bucket"""
+        path = QPainterPath()
+        for (x1, y1), (x2, y2) in zip(self.segment_starts[segments].tolist(), self.segment_ends[segments].tolist()):
+            path.moveTo(x1, y1)
+            path.lineTo(x2, y2)
+        
+        item = self.network_pool.acquire()
+        item.setPath(path)
+        self.scene.addItem(item)
+        return [item]
 
-            for line in lines:
-                coords = list(line.coords)
-                for i in range(len(coords) - 1):
-                    x1, y1 = coords[i]
-                    x2, y2 = coords[i + 1]
-
-                    line_item = QGraphicsLineItem(x1, y1, x2, y2)
-                    line_item.setPen(pen)
-                    self.scene.addItem(line_item)
-
-    def draw_business_points(self, business_df):
-        """Draw business points on the map"""
-        print(f"Drawing {len(business_df)} business points...")
-        
-        for idx, row in business_df.iterrows():
-            try:
-                # Extract geometry from the point column
-                point_geom = row['point']
-                
-                if isinstance(point_geom, Point):
-                    # Get coordinates
-                    lon, lat = point_geom.x, point_geom.y
-                    
-                    # Convert to Web Mercator
-                    x, y = self.view.lat_lon_to_web_mercator(lat, lon)
-                    
-                    # Create business info dictionary
-                    business_info = {
-                        'busid': row.get('busid', 'N/A'),
-                        'tradename': row.get('tradename', 'Unknown Business'),
-                        'homeoccind': row.get('homeoccind', 'N/A'),
-                        'jobstatusdesc': row.get('jobstatusdesc', 'N/A'),
-                        'lat': lat,
-                        'lon': lon
-                    }
-                    
-                    # Create business point item
-                    business_item = BusinessPointItem(x, y, business_info)
-                    
-                    # Add to scene and store reference
-                    self.scene.addItem(business_item)
-                    self.view.business_items.append(business_item)
-                    
-            except Exception as e:
-                print(f"Error processing business point {idx}: {e}")
-                continue
-        
-        print(f"Successfully added {len(self.view.business_items)} business points to map")
+    def release_network_bucket(self, items):
+        for item in items:
+            self.scene.removeItem(item)
+            self.network_pool.release(item)
 
-    def update_tiles(self):
-        zoom_level = 15
-        self.tile_layer.update_tiles(self.scene.sceneRect(), zoom_level)
+    def create_business_bucket(self, rows):
+        items = []
+        for row in rows.tolist():
+            business_item = self.business_pool.acquire()
+            business_item.set_row(row)
+            self.scene.addItem(business_item)
+            self.view.business_items[row] = business_item
+            items.append(business_item)
+        return items
+
+    def release_business_bucket(self, items):
+        for business_item in items:
+            business_item.clear_hover()
+            self.scene.removeItem(business_item)
+            del self.view.business_items[business_item.row]
+            self.business_pool.release(business_item)
+
+    def focus_on(self, x, y, zoom=8.0):
+        """Center the view on a projected point, zooming in if needed"""
+        if self.view.current_zoom < zoom:
+            factor = zoom / self.view.current_zoom
+            self.view.scale(factor, factor)
+            self.view.current_zoom = zoom
+        self.view.centerOn(x, y)
+        self.view.constrain_to_bounds()
+        self.update_tiles()
+
+    def set_route_destination(self, x, y):
+        """Route to the network position nearest a projected point, from the current location"""
+        destination = self.network_grid.locate(x, y)
+        self.route_tree = RouteTree(self.network, destination)
+        self.update_route()
+
+    def clear_route(self):
+        self.route_tree = None
+        if self.route_item is not None:
+            self.route_item.setVisible(False)
+        self.planning_panel.show_route_status("", False)
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape and self.route_tree is not None:
+            self.clear_route()
+            return
+        super().keyPressEvent(event)
+
+    def update_route(self):
+        """Redraw the active route from the current matched position"""
+        if self.route_tree is None:
+            return
+        if self.current_position is None:
+            if self.route_item is not None:
+                self.route_item.setVisible(False)
+            message = ("You are off the +15 network" if self.off_network
+                       else "Destination set; enable location to route from your position")
+            self.planning_panel.show_route_status(message, True)
+            return
+
+        distance, coords = self.route_tree.route_from(self.current_position)
+        if not coords:
+            if self.route_item is not None:
+                self.route_item.setVisible(False)
+            self.planning_panel.show_route_status("Destination is not reachable through the +15 network", True)
+            return
+
+        path = QPainterPath(QPointF(*coords[0]))
+        for x, y in coords[1:]:
+            path.lineTo(x, y)
+
+        if self.route_item is None:
+            pen = QPen(QColor("#007bff"))
+            pen.setWidth(6)
+            pen.setCapStyle(Qt.RoundCap)
+            pen.setJoinStyle(Qt.RoundJoin)
+            self.route_item = QGraphicsPathItem()
+            self.route_item.setPen(pen)
+            self.route_item.setZValue(5)
+            self.scene.addItem(self.route_item)
+
+        self.route_item.setPath(path)
+        self.route_item.setVisible(True)
+        self.planning_panel.show_route_status(f"{distance:.0f} m remaining", True)
+
+    def show_isochrone(self):
+        """Show walking reach from the current location, or the view center without one"""
+        if self.current_position is not None:
+            x, y = self.current_position.x, self.current_position.y
+            self.isochrone_follows_location = True
+        else:
+            center = self.view.mapToScene(self.view.viewport().rect().center())
+            x, y = center.x(), center.y()
+            self.isochrone_follows_location = False
+        
+        if self.isochrone_marker is None:
+            self.isochrone_marker = IsochroneMarker(self.on_isochrone_marker_moved)
+            self.scene.addItem(self.isochrone_marker)
+        
+        self.isochrone_marker.setVisible(True)
+        self.isochrone_marker.setPos(x, y)
+        if self.isochrone is None:
+            # Marker was already there, so no move notification recomputed it
+            self.update_isochrone(x, y)
+
+    def hide_isochrone(self):
+        self.isochrone = None
+        if self.isochrone_marker is not None:
+            self.isochrone_marker.setVisible(False)
+        for item in self.isochrone_items.values():
+            item.setVisible(False)
+        if self.isochrone_business_item is not None:
+            self.isochrone_business_item.setVisible(False)
+
+    def on_isochrone_marker_moved(self, x, y):
+        if self.isochrone_marker.isUnderMouse():
+            self.isochrone_follows_location = False
+        self.update_isochrone(x, y)
+
+    def update_isochrone(self, x, y):
+        """One bounded search for all thresholds, drawn as one path item per band"""
+        self.isochrone = Isochrone(self.network, self.network_grid.locate(x, y), DEFAULT_THRESHOLDS)
+        
+        if self.business_access is None:
+            self.business_access = self.network.locate_many(self.business_records.x, self.business_records.y)
+        
+        colors = ["#2e7d32", "#f9a825", "#ef6c00", "#c62828"]
+        business_path = QPainterPath()
+        reached = set()
+        
+        for band, minutes in enumerate(self.isochrone.thresholds):
+            path = QPainterPath()
+            for (x1, y1), (x2, y2) in self.isochrone.segment_pieces(minutes):
+                path.moveTo(x1, y1)
+                path.lineTo(x2, y2)
+            
+            item = self.isochrone_items.get(minutes)
+            if item is None:
+                pen = QPen(QColor(colors[band % len(colors)]))
+                pen.setWidth(8)
+                pen.setCapStyle(Qt.RoundCap)
+                item = QGraphicsPathItem()
+                item.setPen(pen)
+                # Smaller thresholds are drawn on top of larger ones
+                item.setZValue(4 - band * 0.1)
+                self.scene.addItem(item)
+                self.isochrone_items[minutes] = item
+            item.setPath(path)
+            item.setVisible(True)
+            
+            for i in self.isochrone.reachable_businesses(self.business_access, minutes):
+                if i not in reached:
+                    reached.add(i)
+                    business_path.addEllipse(QPointF(self.business_records.x[i], self.business_records.y[i]), 7, 7)
+        
+        if self.isochrone_business_item is None:
+            self.isochrone_business_item = QGraphicsPathItem()
+            self.isochrone_business_item.setPen(QPen(QColor("#2e7d32"), 2))
+            self.isochrone_business_item.setZValue(6)
+            self.scene.addItem(self.isochrone_business_item)
+        self.isochrone_business_item.setPath(business_path)
+        self.isochrone_business_item.setVisible(True)
 
-    def eventFilter(self, obj, event):
-        if event.type() in (QEvent.Wheel, QEvent.MouseMove):
-            self.update_tiles()
-        return super().eventFilter(obj, event)
+    def on_view_changed(self):
+        self.update_tiles()
+        self.update_features()
+
+    def update_tiles(self):
+        """Load tiles for the visible area at the zoom matching the view scale, then prefetch ahead"""
+        rect = self.view.visible_scene_rect()
+        zoom_level = self.tile_layer.pick_zoom(1 / abs(self.view.transform().m11()))
+        self.tile_layer.update_tiles(rect, zoom_level)
+        self.tile_prefetcher.observe(rect, zoom_level)
 
     def setup_location_services(self):
         """Set up location services"""
@@ -715,12 +1100,11 @@ class Plus15Map(QMainWindow):
             self.location_source.stopUpdates()
             self.location_enabled = False
             
-            if self.view.user_location_item:
-                self.scene.removeItem(self.view.user_location_item)
-                self.view.user_location_item = None
-            if self.view.user_accuracy_item:
-                self.scene.removeItem(self.view.user_accuracy_item)
-                self.view.user_accuracy_item = None
+            self.view.hide_user_location()
+            self.map_matcher.reset()
+            self.current_position = None
+            self.off_network = False
+            self.update_route()
             
             self.location_button.setStyleSheet("""
                 QPushButton {
@@ -753,9 +1137,21 @@ class Plus15Map(QMainWindow):
             if position_info.hasAttribute(QGeoPositionInfo.HorizontalAccuracy):
                 accuracy = position_info.attribute(QGeoPositionInfo.HorizontalAccuracy)
             
-            self.view.update_user_location(x, y, accuracy)
+            # Snap the fix onto the +15 network and draw the marker there; off the network it stays where reported
+            self.current_position = self.map_matcher.match(x, y, accuracy)
+            self.off_network = self.current_position is None
+            if self.off_network:
+                self.view.update_user_location(x, y, accuracy)
+            else:
+                self.view.update_user_location(
+                    self.current_position.x, self.current_position.y, accuracy, accuracy_center=(x, y)
+                )
+            self.update_route()
+            if self.current_position is not None and self.isochrone is not None and self.isochrone_follows_location:
+                self.isochrone_marker.setPos(self.current_position.x, self.current_position.y)
             
-            print(f"Location updated: {lat:.6f}, {lon:.6f} (accuracy: {accuracy}m)")
+            segment = "off network" if self.current_position is None else f"segment {self.current_position.segment}"
+            print(f"Location updated: {lat:.6f}, {lon:.6f} (accuracy: {accuracy}m, {segment})")
         else:
             print("Invalid position received")
 
@@ -776,12 +1172,23 @@ class Plus15Map(QMainWindow):
 if __name__ == "__main__":
     app = QApplication(sys.argv)
 
-    # Load both datasets
-    gdf = paths()
+    # Load both datasets from the refreshed snapshots; walkway centerlines are extracted once from the polygons and cached
+    gdf = load_or_build(mapCached)
     gdf_projected = gdf.to_crs(epsg=3857)
     
-    business_df = businessData()
+    business_df = businessCached()
+    
+    # A transcoded basemap tree can be used instead with --tiles <root>
+    tiles_root = BASEMAP_TILES
+    if "--tiles" in sys.argv[:-1]:
+        tiles_root = sys.argv[sys.argv.index("--tiles") + 1]
+    
+    # --overlay-tiles draws the network and businesses from pre-rendered tiles; business
+    # filters and hover labels need the vector items and are unavailable in that mode
+    window = Plus15Map(gdf_projected, business_df, overlay_tiles="--overlay-tiles" in sys.argv, tiles_root=tiles_root)
+    
+    # The window keeps compact copies; release the source frames
+    del gdf, gdf_projected, business_df
     
-    window = Plus15Map(gdf_projected, business_df)
     window.show()
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,60 @@
+from network import MERCATOR_SCALE
+
+# Candidate search radius in ground metres, derived from the fix's reported accuracy
+MIN_SEARCH_RADIUS = 10
+MAX_SEARCH_RADIUS = 100
+DEFAULT_ACCURACY = 25
+
+# Fixes further than this from every segment (ground metres) are off the network
+MAX_SNAP_DISTANCE = MAX_SEARCH_RADIUS
+
+# Extra cost (ground metres) for jumping to a segment unconnected to the previous match
+DISCONTINUITY_PENALTY = 15
+# Extra cost for moving onto a segment sharing a node with the previous match
+ADJACENT_PENALTY = 3
+
+class MapMatcher:
+    """Snaps position fixes to +15 segments, favouring continuity with the previous match"""
+    def __init__(self, network, locate=None, max_snap=MAX_SNAP_DISTANCE):
+        self.network = network
+        self.max_snap = max_snap
+        # Fallback snap when no segment is within the search radius
+        self.locate = locate or network.locate
+        self.previous = None
+
+    def reset(self):
+        self.previous = None
+
+    def search_radius(self, accuracy):
+        """Search radius in EPSG:3857 metres for a fix with the given accuracy (ground metres)"""
+        if accuracy is None or accuracy <= 0:
+            accuracy = DEFAULT_ACCURACY
+        radius = min(max(accuracy, MIN_SEARCH_RADIUS), MAX_SEARCH_RADIUS)
+        return radius / MERCATOR_SCALE
+
+    def continuity_penalty(self, segment):
+        if self.previous is None or segment == self.previous.segment:
+            return 0
+
+        network = self.network
+        previous_nodes = {network.seg_u[self.previous.segment], network.seg_v[self.previous.segment]}
+        if network.seg_u[segment] in previous_nodes or network.seg_v[segment] in previous_nodes:
+            return ADJACENT_PENALTY
+        return DISCONTINUITY_PENALTY
+
+    def match(self, x, y, accuracy=None):
+        """Best network position for a projected fix, or None when it is off the network"""
+        candidates = self.network.candidates(x, y, self.search_radius(accuracy))
+
+        if candidates:
+            best = min(
+                candidates,
+                key=lambda c: c.distance * MERCATOR_SCALE + self.continuity_penalty(c.segment)
+            )
+        else:
+            best = self.locate(x, y)
+            if best.distance * MERCATOR_SCALE > self.max_snap:
+                best = None
+
+        self.previous = best
+        return best
@@ -0,0 +1,272 @@
+import math
+import heapq
+from collections import namedtuple
+
+import numpy as np
+import shapely
+from shapely.geometry import Point
+
+from compact_store import LineGeometry
+
+# Vertices closer than this (EPSG:3857 metres) are merged into one network node
+NODE_TOLERANCE = 0.5
+
+# Ground metres per EPSG:3857 metre at downtown Calgary's latitude
+MERCATOR_SCALE = math.cos(math.radians(51.0469))
+
+# Walking speed used to turn network distances into times (ground metres per second)
+WALKING_SPEED = 1.3
+
+# A point on the network: segment index, snapped coordinates, fraction along
+# the segment from seg_u to seg_v, and distance from the query point (EPSG:3857)
+NetworkPosition = namedtuple("NetworkPosition", ["segment", "x", "y", "fraction", "distance"])
+
+# Arrays that fully describe a built network, e.g. for sharing between processes
+NETWORK_ARRAYS = ("node_x", "node_y", "seg_u", "seg_v", "seg_length",
+                  "indptr", "indices", "weights", "edge_segment")
+
+class Plus15Network:
+    """Undirected +15 walkway graph stored as CSR arrays, with a segment spatial index"""
+    def __init__(self, node_x, node_y, seg_u, seg_v):
+        self.node_x = np.asarray(node_x, dtype=np.float64)
+        self.node_y = np.asarray(node_y, dtype=np.float64)
+        self.seg_u = np.asarray(seg_u, dtype=np.int32)
+        self.seg_v = np.asarray(seg_v, dtype=np.int32)
+
+        # Edge weights are ground metres, not projected metres
+        self.seg_length = np.hypot(
+            self.node_x[self.seg_v] - self.node_x[self.seg_u],
+            self.node_y[self.seg_v] - self.node_y[self.seg_u]
+        ) * MERCATOR_SCALE
+
+        self.build_csr()
+        self.segment_tree = shapely.STRtree(self.segment_geometries())
+        self._adjacency = None
+
+    @classmethod
+    def from_lines(cls, gdf, tolerance=NODE_TOLERANCE):
+        """Build the network from projected (EPSG:3857) LineString/MultiLineString geometry"""
+        return cls.from_geometry(LineGeometry.from_geometries(gdf.geometry.values), tolerance)
+
+    @classmethod
+    def from_geometry(cls, geometry, tolerance=NODE_TOLERANCE):
+        """Build the network from flat LineGeometry coordinates"""
+        coords = geometry.coords
+
+        # Consecutive coordinate pairs, except those spanning the end of one line and the start of the next
+        within_line = np.ones(max(len(coords) - 1, 0), dtype=bool)
+        within_line[geometry.offsets[1:-1] - 1] = False
+        starts = coords[:-1][within_line]
+        ends = coords[1:][within_line]
+
+        keys = np.round(np.concatenate([starts, ends]) / tolerance).astype(np.int64)
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        nodes = unique_keys * tolerance
+
+        seg_u = inverse[:len(starts)]
+        seg_v = inverse[len(starts):]
+
+        # Drop segments collapsed by node merging and duplicates of shared edges
+        keep = seg_u != seg_v
+        pairs = np.sort(np.column_stack([seg_u[keep], seg_v[keep]]), axis=1)
+        pairs = np.unique(pairs, axis=0)
+
+        print(f"Built +15 network: {len(nodes)} nodes, {len(pairs)} segments")
+        return cls(nodes[:, 0], nodes[:, 1], pairs[:, 0], pairs[:, 1])
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Wrap already built network arrays (e.g. views onto shared memory) without copying them"""
+        network = cls.__new__(cls)
+        for name in NETWORK_ARRAYS:
+            setattr(network, name, arrays[name])
+        network.segment_tree = shapely.STRtree(network.segment_geometries())
+        network._adjacency = None
+        return network
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in NETWORK_ARRAYS}
+
+    @property
+    def node_count(self):
+        return len(self.node_x)
+
+    @property
+    def segment_count(self):
+        return len(self.seg_u)
+
+    def build_csr(self):
+        """Store both directions of every segment, grouped by source node"""
+        sources = np.concatenate([self.seg_u, self.seg_v])
+        targets = np.concatenate([self.seg_v, self.seg_u])
+        segments = np.concatenate([np.arange(self.segment_count)] * 2).astype(np.int32)
+
+        order = np.argsort(sources, kind="stable")
+        self.indices = targets[order]
+        self.weights = self.seg_length[segments[order]]
+        self.edge_segment = segments[order]
+        self.indptr = np.zeros(self.node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=self.node_count), out=self.indptr[1:])
+
+    def segment_geometries(self):
+        coords = np.stack([
+            np.column_stack([self.node_x[self.seg_u], self.node_y[self.seg_u]]),
+            np.column_stack([self.node_x[self.seg_v], self.node_y[self.seg_v]]),
+        ], axis=1)
+        return shapely.linestrings(coords)
+
+    def adjacency(self):
+        """CSR arrays as Python lists, which are much faster to index from a Python search loop"""
+        if self._adjacency is None:
+            self._adjacency = (self.indptr.tolist(), self.indices.tolist(), self.weights.tolist())
+        return self._adjacency
+
+    def snap(self, xs, ys, segments):
+        """Closest points on the given segments: snapped x, y, fraction along and distance"""
+        segments = np.asarray(segments, dtype=np.int64)
+        ux = self.node_x[self.seg_u[segments]]
+        uy = self.node_y[self.seg_u[segments]]
+        dx = self.node_x[self.seg_v[segments]] - ux
+        dy = self.node_y[self.seg_v[segments]] - uy
+
+        length_sq = dx * dx + dy * dy
+        fraction = np.clip(((xs - ux) * dx + (ys - uy) * dy) / np.where(length_sq > 0, length_sq, 1), 0, 1)
+        px = ux + fraction * dx
+        py = uy + fraction * dy
+        return px, py, fraction, np.hypot(px - xs, py - ys)
+
+    def project(self, x, y, segments):
+        """Snap a point onto each of the given segments"""
+        px, py, fraction, distance = self.snap(x, y, segments)
+        return [NetworkPosition(int(s), float(sx), float(sy), float(f), float(d))
+                for s, sx, sy, f, d in zip(segments, px, py, fraction, distance)]
+
+    def candidates(self, x, y, radius):
+        """All network positions within radius (EPSG:3857 metres) of a point, nearest first"""
+        segments = self.segment_tree.query(Point(x, y), predicate="dwithin", distance=radius)
+        return sorted(self.project(x, y, segments), key=lambda position: position.distance)
+
+    def locate(self, x, y):
+        """Nearest network position to a point"""
+        segment = self.segment_tree.query_nearest(Point(x, y))[0]
+        return self.project(x, y, [segment])[0]
+
+    def locate_many(self, xs, ys):
+        """Nearest segment, fraction along it and snap distance for arrays of points"""
+        points = shapely.points(xs, ys)
+        point_index, segments = self.segment_tree.query_nearest(points)
+
+        # Ties return several segments per point; keep the first
+        first = np.unique(point_index, return_index=True)[1]
+        point_index = point_index[first]
+        segments = segments[first]
+
+        result_segments = np.full(len(points), -1, dtype=np.int64)
+        fractions = np.zeros(len(points))
+        distances = np.full(len(points), np.inf)
+
+        _, _, fraction, distance = self.snap(np.asarray(xs)[point_index], np.asarray(ys)[point_index], segments)
+        result_segments[point_index] = segments
+        fractions[point_index] = fraction
+        distances[point_index] = distance
+        return result_segments, fractions, distances
+
+    def position_sources(self, position):
+        """Search seeds reaching both ends of a position's segment"""
+        length = self.seg_length[position.segment]
+        return [
+            (int(self.seg_u[position.segment]), position.fraction * length),
+            (int(self.seg_v[position.segment]), (1 - position.fraction) * length),
+        ]
+
+    def search(self, sources, max_cost=math.inf, target=None):
+        """Multi-source Dijkstra from (node, initial cost) seeds, optionally bounded by cost.
+
+        Returns per-node distance (ground metres) and predecessor lists.
+        """
+        indptr, indices, weights = self.adjacency()
+        dist = [math.inf] * self.node_count
+        pred = [-1] * self.node_count
+
+        heap = []
+        for node, cost in sources:
+            if cost < dist[node] and cost <= max_cost:
+                dist[node] = cost
+                heap.append((cost, node))
+        heapq.heapify(heap)
+
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if u == target:
+                break
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                nd = d + weights[k]
+                if nd < dist[v] and nd <= max_cost:
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd, v))
+
+        return dist, pred
+
+    def node_path(self, pred, node):
+        """Follow predecessor links from a node back to its search source"""
+        path = [node]
+        while pred[node] != -1:
+            node = pred[node]
+            path.append(node)
+        return path
+
+    def node_coordinates(self, nodes):
+        return [(float(self.node_x[n]), float(self.node_y[n])) for n in nodes]
+
+def to_web_mercator(lon, lat):
+    """Longitude/latitude to EPSG:3857 x/y (scalars or arrays)"""
+    x = np.asarray(lon) * 20037508.34 / 180
+    y = np.log(np.tan((90 + np.asarray(lat)) * np.pi / 360)) / (np.pi / 180)
+    return x, y * 20037508.34 / 180
+
+def to_lon_lat(x, y):
+    """EPSG:3857 x/y to longitude/latitude (scalars or arrays)"""
+    lon = np.asarray(x) * 180 / 20037508.34
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y) * np.pi / 20037508.34)) - np.pi / 2)
+    return lon, lat
+
+class RouteTree:
+    """Shortest-path tree rooted at a fixed destination.
+
+    The search runs once when the destination is set; routing from any later
+    position only walks predecessor links, so re-routing on every GPS fix costs
+    O(route length) instead of a new search.
+    """
+    def __init__(self, network, destination):
+        self.network = network
+        self.destination = destination
+        self.dist, self.next_hop = network.search(network.position_sources(destination))
+
+    def route_from(self, position):
+        """Distance in ground metres and EPSG:3857 coordinates from a network position to the destination"""
+        network = self.network
+        destination = self.destination
+
+        if position.segment == destination.segment:
+            length = network.seg_length[position.segment]
+            distance = abs(position.fraction - destination.fraction) * length
+            return distance, [(position.x, position.y), (destination.x, destination.y)]
+
+        best_node = -1
+        best_distance = math.inf
+        for node, cost in network.position_sources(position):
+            if cost + self.dist[node] < best_distance:
+                best_node = node
+                best_distance = cost + self.dist[node]
+
+        if best_node == -1:
+            return math.inf, []
+
+        nodes = network.node_path(self.next_hop, best_node)
+        coords = [(position.x, position.y)] + network.node_coordinates(nodes) + [(destination.x, destination.y)]
+        return best_distance, coords
@@ -0,0 +1,132 @@
+import os
+import math
+import hashlib
+import numpy as np
+import shapely
+
+from network import MERCATOR_SCALE, NetworkPosition
+from compact_store import smallest_int_dtype
+
+NETWORK_GRID_PATH = "plus15_network_grid.npz"
+GRID_VERSION = 1
+
+# Cell size in ground metres
+GRID_RESOLUTION = 10.0
+
+def network_signature(network, bounds, resolution):
+    """Hash of the geometry and grid layout a lookup grid was built for"""
+    digest = hashlib.sha1()
+    for array in (network.node_x, network.node_y, network.seg_u, network.seg_v):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(np.array(list(bounds) + [resolution, GRID_VERSION], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+class NetworkGrid:
+    """Nearest network segment for every cell of a fixed grid over the map bounds
+
+    locate() reads the cell under a point and its 8 neighbours, adds the
+    segments touching those, and projects onto that handful, so the cost
+    doesn't grow with the network.
+    """
+    def __init__(self, network, bounds, cells, cell_size, signature=None):
+        self.network = network
+        self.left, self.bottom, self.right, self.top = bounds
+        self.cells = cells
+        self.cell_size = cell_size
+        self.signature = signature
+        self._segment_lists = None
+
+    @classmethod
+    def build(cls, network, bounds, resolution=GRID_RESOLUTION):
+        left, bottom, right, top = bounds
+        cell_size = resolution / MERCATOR_SCALE
+        columns = int(np.ceil((right - left) / cell_size))
+        rows = int(np.ceil((top - bottom) / cell_size))
+
+        xs = left + (np.arange(columns) + 0.5) * cell_size
+        ys = bottom + (np.arange(rows) + 0.5) * cell_size
+        centers = shapely.points(*[a.ravel() for a in np.meshgrid(xs, ys)])
+        point_index, segments = network.segment_tree.query_nearest(centers)
+
+        # Ties return several segments per cell; keep the first
+        first = np.unique(point_index, return_index=True)[1]
+        cells = np.empty(rows * columns, dtype=smallest_int_dtype(network.segment_count))
+        cells[point_index[first]] = segments[first]
+        return cls(network, bounds, cells.reshape(rows, columns), cell_size,
+                   network_signature(network, bounds, resolution))
+
+    @classmethod
+    def load_or_build(cls, network, bounds, resolution=GRID_RESOLUTION, path=NETWORK_GRID_PATH):
+        """Load the saved grid if it was built for this network and extent, otherwise rebuild and save it"""
+        bounds = tuple(float(v) for v in bounds)
+        signature = network_signature(network, bounds, resolution)
+        if os.path.exists(path):
+            try:
+                with np.load(path) as saved:
+                    if str(saved["signature"]) == signature:
+                        print(f"Loaded network lookup grid from {path}")
+                        return cls(network, bounds, saved["cells"], float(saved["cell_size"]), signature)
+            except Exception as e:
+                print(f"Ignoring unreadable network lookup grid {path}: {e}")
+
+        grid = cls.build(network, bounds, resolution)
+        grid.save(path)
+        rows, columns = grid.cells.shape
+        print(f"Built {columns}x{rows} network lookup grid ({grid.cells.nbytes / 1024:.0f} KiB)")
+        return grid
+
+    def save(self, path=NETWORK_GRID_PATH):
+        np.savez(path, cells=self.cells, cell_size=self.cell_size, signature=self.signature)
+
+    def cell(self, x, y):
+        """Row and column of the cell containing a point, or None outside the grid"""
+        if not (self.left <= x < self.right and self.bottom <= y < self.top):
+            return None
+        return int((y - self.bottom) / self.cell_size), int((x - self.left) / self.cell_size)
+
+    def segment_lists(self):
+        """Segment end coordinates and touching segments as Python lists, cheap to read per lookup"""
+        if self._segment_lists is None:
+            network = self.network
+            indptr = network.indptr.tolist()
+            edge_segment = network.edge_segment.tolist()
+            touching = []
+            for u, v in zip(network.seg_u.tolist(), network.seg_v.tolist()):
+                touching.append(set(edge_segment[indptr[u]:indptr[u + 1]] + edge_segment[indptr[v]:indptr[v + 1]]))
+            ends = list(zip(network.node_x[network.seg_u].tolist(), network.node_y[network.seg_u].tolist(),
+                            network.node_x[network.seg_v].tolist(), network.node_y[network.seg_v].tolist()))
+            self._segment_lists = (ends, touching)
+        return self._segment_lists
+
+    def locate(self, x, y):
+        """Nearest network position to a point; falls back to a tree search outside the grid"""
+        cell = self.cell(x, y)
+        if cell is None:
+            return self.network.locate(x, y)
+        row, column = cell
+        ends, touching = self.segment_lists()
+
+        # Short segments next to the ones found can be nearest without owning any cell centre
+        candidates = set()
+        for segment in set(self.cells[max(row - 1, 0):row + 2, max(column - 1, 0):column + 2].ravel().tolist()):
+            candidates |= touching[segment]
+
+        best = None
+        for segment in candidates:
+            ux, uy, vx, vy = ends[segment]
+            dx = vx - ux
+            dy = vy - uy
+            length_sq = dx * dx + dy * dy
+            fraction = min(max(((x - ux) * dx + (y - uy) * dy) / length_sq, 0.0), 1.0) if length_sq > 0 else 0.0
+            px = ux + fraction * dx
+            py = uy + fraction * dy
+            distance = math.hypot(px - x, py - y)
+            if best is None or distance < best.distance:
+                best = NetworkPosition(segment, px, py, fraction, distance)
+        return best
+
+    def nearest_node(self, x, y):
+        """The network node at the near end of the nearest segment"""
+        position = self.locate(x, y)
+        segment = position.segment
+        return int(self.network.seg_u[segment] if position.fraction <= 0.5 else self.network.seg_v[segment])
@@ -0,0 +1,159 @@
+"""Pre-render the +15 network and business points into transparent overlay tiles.
+
+    python app/overlay_tiles.py                  # every zoom in the basemap tree
+    python app/overlay_tiles.py --zooms 15 16 17
+
+Tiles are written to tiles_overlay/<layer>/{z}/{x}/{y}.png, next to the
+basemap tile trees, and are composited by TileLayer when the map runs with
+--overlay-tiles. In that mode businesses are part of the raster, so the
+attribute filters and hover labels are unavailable and the filter lists
+are not shown.
+
+By default one overlay is rendered per zoom level present in the basemap
+tree, so TileLayer never has to scale a coarser overlay up over sharper
+basemap tiles.
+"""
+import os
+import argparse
+
+import numpy as np
+import mercantile
+import shapely
+from PySide6.QtGui import QGuiApplication, QImage, QPainter, QPen, QBrush
+from PySide6.QtCore import Qt, QPointF, QLineF
+
+from data import businessLocal, businessPoints
+from centerlines import load_or_build
+from compact_store import LineGeometry
+from network import to_lon_lat
+from tile_loader import BASEMAP_TILES, available_zooms
+
+OVERLAY_TILES_DIR = "tiles_overlay"
+OVERLAY_LAYERS = ("network", "businesses")
+DEFAULT_ZOOMS = (15,)
+TILE_SIZE = 256
+
+# Same world-unit styling as Plus15Map's network items and BusinessPointItem
+LINE_WIDTH = 3
+POINT_RADIUS = 4
+# Never let features shrink below this many pixels at low zoom levels
+MIN_PIXEL_WIDTH = 1.0
+
+def tile_transform(tile):
+    """Scale and offset mapping EPSG:3857 metres to pixels within a tile"""
+    bounds = mercantile.xy_bounds(tile)
+    scale = TILE_SIZE / (bounds.right - bounds.left)
+    return bounds, scale
+
+def to_pixel(bounds, scale, x, y):
+    return QPointF((x - bounds.left) * scale, (bounds.top - y) * scale)
+
+def new_tile_image():
+    image = QImage(TILE_SIZE, TILE_SIZE, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    return image
+
+def save_tile(image, root, tile):
+    out_dir = os.path.join(root, str(tile.z), str(tile.x))
+    os.makedirs(out_dir, exist_ok=True)
+    image.save(os.path.join(out_dir, f"{tile.y}.png"))
+
+def covering_tiles(xmin, ymin, xmax, ymax, zoom):
+    west, south = to_lon_lat(xmin, ymin)
+    east, north = to_lon_lat(xmax, ymax)
+    return mercantile.tiles(float(west), float(south), float(east), float(north), zoom)
+
+def render_network(geometry, root, zoom):
+    """Rasterize every network segment into the tiles it crosses; returns the number of tiles written"""
+    starts, ends = geometry.segments()
+    tree = shapely.STRtree(shapely.linestrings(np.stack([starts, ends], axis=1)))
+
+    xmin, ymin = geometry.coords.min(axis=0)
+    xmax, ymax = geometry.coords.max(axis=0)
+
+    written = 0
+    for tile in covering_tiles(xmin, ymin, xmax, ymax, zoom):
+        bounds, scale = tile_transform(tile)
+        width = max(LINE_WIDTH * scale, MIN_PIXEL_WIDTH)
+
+        # Pad the query by the line width so strokes overlapping from neighbouring tiles are drawn
+        pad = width / scale
+        hits = tree.query(shapely.box(bounds.left - pad, bounds.bottom - pad, bounds.right + pad, bounds.top + pad))
+        if len(hits) == 0:
+            continue
+
+        image = new_tile_image()
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        pen = QPen(Qt.red)
+        pen.setWidthF(width)
+        pen.setCapStyle(Qt.RoundCap)
+        painter.setPen(pen)
+        painter.drawLines([
+            QLineF(to_pixel(bounds, scale, *starts[i]), to_pixel(bounds, scale, *ends[i])) for i in hits
+        ])
+        painter.end()
+
+        save_tile(image, root, tile)
+        written += 1
+    return written
+
+def render_businesses(xs, ys, root, zoom):
+    """Rasterize business points into the tiles they fall in; returns the number of tiles written"""
+    valid = np.isfinite(xs) & np.isfinite(ys)
+    xs = xs[valid]
+    ys = ys[valid]
+    if len(xs) == 0:
+        return 0
+
+    written = 0
+    for tile in covering_tiles(xs.min(), ys.min(), xs.max(), ys.max(), zoom):
+        bounds, scale = tile_transform(tile)
+        radius = max(POINT_RADIUS * scale, MIN_PIXEL_WIDTH)
+        pad = radius / scale + 1 / scale
+
+        inside = np.flatnonzero(
+            (xs >= bounds.left - pad) & (xs <= bounds.right + pad)
+            & (ys >= bounds.bottom - pad) & (ys <= bounds.top + pad)
+        )
+        if len(inside) == 0:
+            continue
+
+        image = new_tile_image()
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(Qt.darkBlue, max(scale, MIN_PIXEL_WIDTH / 2)))
+        painter.setBrush(QBrush(Qt.blue))
+        for i in inside:
+            painter.drawEllipse(to_pixel(bounds, scale, xs[i], ys[i]), radius, radius)
+        painter.end()
+
+        save_tile(image, root, tile)
+        written += 1
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Render +15 network and business overlay tiles")
+    parser.add_argument("--zooms", type=int, nargs="+", default=None,
+                        help="zoom levels to render (default: every zoom in the basemap tree)")
+    parser.add_argument("--basemap", default=BASEMAP_TILES, help="basemap tree whose zooms are matched")
+    parser.add_argument("--output", default=OVERLAY_TILES_DIR)
+    args = parser.parse_args()
+
+    # Rendering needs a GUI application but never a display
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QGuiApplication([])
+
+    geometry = LineGeometry.from_geometries(load_or_build().to_crs(epsg=3857).geometry.values)
+    business_x, business_y = businessPoints(businessLocal())
+
+    zooms = args.zooms or available_zooms(args.basemap) or list(DEFAULT_ZOOMS)
+    for zoom in zooms:
+        network_tiles = render_network(geometry, os.path.join(args.output, "network"), zoom)
+        business_tiles = render_businesses(business_x, business_y, os.path.join(args.output, "businesses"), zoom)
+        print(f"Zoom {zoom}: {network_tiles} network tiles, {business_tiles} business tiles")
+
+    print(f"Overlay tiles written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Refresh the local dataset snapshots, downloading only what changed.
+
+    python app/refresh.py                       # refresh every dataset
+    python app/refresh.py businesses            # one dataset
+    python app/refresh.py --root http://localhost:8000   # against a stand-in server
+"""
+import io
+import os
+import json
+import shutil
+import hashlib
+import argparse
+
+import requests
+import pandas as pd
+import geopandas as gpd
+
+from data import MAP_SNAPSHOT, BUSINESS_SNAPSHOT
+from search_index import SEARCH_INDEX_PATH
+from overlay_tiles import OVERLAY_TILES_DIR
+from centerlines import CENTERLINE_SNAPSHOT
+from network_grid import NETWORK_GRID_PATH
+
+SOCRATA_ROOT = "https://data.calgary.ca"
+MANIFEST_PATH = "data_manifest.json"
+PAGE_SIZE = 1000
+TIMEOUT = 30
+
+HEADERS = {
+    "User-Agent": "Plus15Map/1.0 (braydenboyko@boykowealth.com)",
+}
+
+DATASETS = {
+    "plus15": {"resource": "3u3x-hrc7", "format": "geojson", "snapshot": MAP_SNAPSHOT, "key": None},
+    "businesses": {"resource": "vdjc-pybd", "format": "csv", "snapshot": BUSINESS_SNAPSHOT, "key": "globalid"},
+}
+
+# Files and directories derived from the snapshots, and the datasets each is built from
+DERIVED_CACHES = {
+    SEARCH_INDEX_PATH: ("businesses",),
+    OVERLAY_TILES_DIR: ("plus15", "businesses"),
+    CENTERLINE_SNAPSHOT: ("plus15",),
+    NETWORK_GRID_PATH: ("plus15",),
+}
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def resource_url(root, spec, fmt=None):
+    return f"{root}/resource/{spec['resource']}.{fmt or spec['format']}"
+
+def read_page(content, fmt):
+    if fmt == "geojson":
+        return gpd.read_file(io.BytesIO(content))
+    return pd.read_csv(io.BytesIO(content))
+
+def probe(session, root, spec):
+    """Latest :updated_at and row count from the server, or None if it doesn't support SoQL"""
+    params = {"$select": "max(:updated_at) AS updated_at, count(*) AS rows"}
+    try:
+        resp = session.get(resource_url(root, spec, "json"), params=params, timeout=TIMEOUT)
+        resp.raise_for_status()
+        row = resp.json()[0]
+        return {"updated_at": row.get("updated_at"), "rows": int(row["rows"])}
+    except (requests.RequestException, ValueError, KeyError, IndexError, TypeError):
+        return None
+
+def fetch_pages(session, root, spec, where=None):
+    """Every row matching an optional SoQL filter, paged in stable :id order"""
+    pages = []
+    digest = hashlib.sha256()
+    offset = 0
+    while True:
+        params = {"$limit": PAGE_SIZE, "$offset": offset, "$order": ":id"}
+        if where:
+            params["$where"] = where
+        resp = session.get(resource_url(root, spec), params=params, timeout=TIMEOUT)
+        resp.raise_for_status()
+        digest.update(resp.content)
+
+        page = read_page(resp.content, spec["format"])
+        pages.append(page)
+        if len(page) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+
+    frame = pd.concat(pages, ignore_index=True)
+    if spec["format"] == "geojson":
+        frame = gpd.GeoDataFrame(frame, geometry="geometry", crs=pages[0].crs)
+    return frame, digest.hexdigest()
+
+def fetch_keys(session, root, spec):
+    """Every key value currently on the server, paged like fetch_pages"""
+    key = spec["key"]
+    keys = set()
+    offset = 0
+    while True:
+        params = {"$select": key, "$limit": PAGE_SIZE, "$offset": offset, "$order": ":id"}
+        resp = session.get(resource_url(root, spec, "json"), params=params, timeout=TIMEOUT)
+        resp.raise_for_status()
+        rows = resp.json()
+        keys.update(str(row[key]) for row in rows if row.get(key) is not None)
+        if len(rows) < PAGE_SIZE:
+            return keys
+        offset += PAGE_SIZE
+
+def fetch_whole(session, root, spec, state):
+    """Plain conditional GET of the resource; None when the server answers 304 Not Modified"""
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+
+    resp = session.get(resource_url(root, spec), headers=headers, timeout=TIMEOUT)
+    if resp.status_code == 304:
+        return None
+    resp.raise_for_status()
+
+    state["etag"] = resp.headers.get("ETag")
+    state["last_modified"] = resp.headers.get("Last-Modified")
+    return read_page(resp.content, spec["format"]), hashlib.sha256(resp.content).hexdigest()
+
+def merge_changes(snapshot, changes, key):
+    """Replace snapshot rows whose key appears in changes, and append new ones"""
+    changes = changes[[c for c in snapshot.columns if c in changes.columns]]
+    kept = snapshot[~snapshot[key].isin(changes[key])]
+    return pd.concat([kept, changes], ignore_index=True)
+
+def write_snapshot(frame, spec):
+    frame.to_feather(spec["snapshot"])
+
+def refresh_dataset(name, session, root=SOCRATA_ROOT, manifest=None):
+    """Bring one snapshot up to date; returns True when its contents changed"""
+    spec = DATASETS[name]
+    state = manifest.setdefault(name, {})
+    have_snapshot = os.path.exists(spec["snapshot"])
+    remote = probe(session, root, spec)
+
+    if remote is None:
+        # No SoQL support: conditional GET, then compare content hashes
+        result = fetch_whole(session, root, spec, state)
+        if result is None or (have_snapshot and result[1] == state.get("sha256")):
+            print(f"{name}: unchanged")
+            return False
+        frame, digest = result
+        write_snapshot(frame, spec)
+        state["sha256"] = digest
+        print(f"{name}: downloaded {len(frame)} rows")
+        return True
+
+    if (have_snapshot and state.get("updated_at") == remote["updated_at"]
+            and state.get("rows") == remote["rows"]):
+        print(f"{name}: unchanged")
+        return False
+
+    if have_snapshot and spec["key"] and state.get("updated_at"):
+        changes, _ = fetch_pages(session, root, spec, where=f":updated_at > '{state['updated_at']}'")
+        merged = merge_changes(pd.read_feather(spec["snapshot"]), changes, spec["key"])
+
+        # Deleted records don't show up as updates, and a deletion can hide behind an insertion
+        # in the row count, so drop whatever keys the server no longer has
+        server_keys = fetch_keys(session, root, spec)
+        local_keys = merged[spec["key"]].astype(str)
+        deleted = ~local_keys.isin(server_keys)
+        merged = merged[~deleted].reset_index(drop=True)
+
+        if len(merged) == remote["rows"] and set(local_keys[~deleted]) == server_keys:
+            write_snapshot(merged, spec)
+            # The merged snapshot matches no single download, so there is no content hash to compare against
+            state.pop("sha256", None)
+            state.update(updated_at=remote["updated_at"], rows=remote["rows"])
+            print(f"{name}: merged {len(changes)} changed rows, removed {int(deleted.sum())} deleted rows")
+            return True
+        print(f"{name}: snapshot keys disagree with the server after merge, fetching everything")
+
+    frame, digest = fetch_pages(session, root, spec)
+    changed = not have_snapshot or digest != state.get("sha256")
+    if changed:
+        write_snapshot(frame, spec)
+    state.update(updated_at=remote["updated_at"], rows=remote["rows"], sha256=digest)
+    print(f"{name}: downloaded {len(frame)} rows" if changed else f"{name}: unchanged")
+    return changed
+
+def invalidate_caches(changed_datasets, caches=DERIVED_CACHES):
+    """Delete derived caches built from any of the changed datasets"""
+    removed = []
+    for path, inputs in caches.items():
+        if not set(inputs) & set(changed_datasets) or not os.path.exists(path):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        removed.append(path)
+        print(f"Invalidated {path}")
+    return removed
+
+def refresh(names=None, root=SOCRATA_ROOT, manifest_path=MANIFEST_PATH):
+    manifest = load_manifest(manifest_path)
+    session = requests.Session()
+    session.headers.update(HEADERS)
+
+    changed = []
+    for name in names or DATASETS:
+        if refresh_dataset(name, session, root, manifest):
+            changed.append(name)
+        # Save after every dataset so a later failure doesn't lose validators
+        save_manifest(manifest, manifest_path)
+
+    invalidate_caches(changed)
+    return changed
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh local +15 and business snapshots")
+    parser.add_argument("datasets", nargs="*", help=f"any of: {', '.join(DATASETS)} (default: all)")
+    parser.add_argument("--root", default=SOCRATA_ROOT, help="open data portal base URL")
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    args = parser.parse_args()
+
+    unknown = set(args.datasets) - set(DATASETS)
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(sorted(unknown))}")
+
+    changed = refresh(args.datasets or None, args.root, args.manifest)
+    print(f"Changed datasets: {', '.join(changed) if changed else 'none'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""Headless HTTP/JSON +15 routing service.
+
+    python app/route_service.py --port 8015 --workers 4
+
+Endpoints (coordinates are lon,lat):
+    GET /route?from=-114.07,51.047&to=-114.06,51.046
+    GET /nearest-business?at=-114.07,51.047&limit=5
+    GET /isochrone?at=-114.07,51.047&minutes=2,5,10
+    GET /metrics
+"""
+import os
+import math
+import json
+import time
+import signal
+import asyncio
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+from data import businessLocal, businessPoints
+from centerlines import load_or_build
+from network import (Plus15Network, RouteTree, NETWORK_ARRAYS, WALKING_SPEED, MERCATOR_SCALE,
+                     to_web_mercator, to_lon_lat)
+from map_matching import MAX_SEARCH_RADIUS
+from isochrone import Isochrone, DEFAULT_THRESHOLDS
+from shared_arrays import SharedArrays, attach_arrays
+from timing import LatencyStats
+
+DEFAULT_PORT = 8015
+
+# Requests beyond this many in flight are rejected with 503 instead of queueing without bound
+MAX_IN_FLIGHT = 256
+QUERY_TIMEOUT = 5.0  # seconds
+
+MAX_NEAREST_MINUTES = 15
+MAX_ISOCHRONE_MINUTES = 60
+# Web Mercator is undefined beyond this latitude
+MAX_LATITUDE = 85.05112878
+MAX_REQUEST_LINE = 8192
+MAX_HEADERS = 64
+MAX_BODY = 64 * 1024
+
+# Shortest-path trees kept per worker, keyed by destination position
+ROUTE_TREE_CACHE_SIZE = 64
+
+class QueryError(Exception):
+    """Bad request parameters, reported to the client as 400"""
+
+# Per-worker state, attached in init_worker
+WORKER = {}
+
+def init_worker(spec, business_busids, business_names):
+    # Shutdown is driven by the parent; don't let Ctrl+C interrupt workers mid-query
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    arrays, blocks = attach_arrays(spec)
+    WORKER["blocks"] = blocks
+    WORKER["network"] = Plus15Network.from_arrays({name: arrays[name] for name in NETWORK_ARRAYS})
+    WORKER["business_access"] = (arrays["business_segment"], arrays["business_fraction"], arrays["business_distance"])
+    WORKER["business_x"] = arrays["business_x"]
+    WORKER["business_y"] = arrays["business_y"]
+    WORKER["business_busids"] = business_busids
+    WORKER["business_names"] = business_names
+    WORKER["route_trees"] = OrderedDict()
+
+def parse_point(params, name):
+    """Projected x, y from a 'lon,lat' query parameter"""
+    if name not in params:
+        raise QueryError(f"missing parameter '{name}'")
+    try:
+        # JSON bodies can carry any type; only a "lon,lat" string is accepted
+        lon, lat = (float(v) for v in params[name].split(","))
+    except (ValueError, TypeError, AttributeError):
+        raise QueryError(f"'{name}' must be lon,lat")
+    if not (math.isfinite(lon) and math.isfinite(lat)) or abs(lon) > 180 or abs(lat) > MAX_LATITUDE:
+        raise QueryError(f"'{name}' must be a longitude within 180 and a latitude within {MAX_LATITUDE:.2f} degrees")
+    x, y = to_web_mercator(lon, lat)
+    return float(x), float(y)
+
+def parse_limit(params):
+    try:
+        limit = int(params.get("limit", 5))
+    except (ValueError, TypeError, OverflowError):
+        raise QueryError("'limit' must be a whole number")
+    if limit < 1:
+        raise QueryError("'limit' must be at least 1")
+    return min(limit, 100)
+
+def parse_minutes(params):
+    try:
+        thresholds = [float(m) for m in params.get("minutes", ",".join(map(str, DEFAULT_THRESHOLDS))).split(",")]
+    except (ValueError, TypeError, AttributeError):
+        raise QueryError("'minutes' must be a comma separated list of numbers")
+    if not all(0 < m <= MAX_ISOCHRONE_MINUTES for m in thresholds):
+        raise QueryError(f"'minutes' must be between 0 and {MAX_ISOCHRONE_MINUTES}")
+    return thresholds
+
+def route_args(params):
+    return {"from": parse_point(params, "from"), "to": parse_point(params, "to")}
+
+def nearest_business_args(params):
+    return {"at": parse_point(params, "at"), "limit": parse_limit(params)}
+
+def isochrone_args(params):
+    return {"at": parse_point(params, "at"), "minutes": parse_minutes(params)}
+
+def lon_lat_coords(coords):
+    xs, ys = np.asarray(coords).T
+    lons, lats = to_lon_lat(xs, ys)
+    return [[round(float(lon), 7), round(float(lat), 7)] for lon, lat in zip(lons, lats)]
+
+def route_tree(destination):
+    """Cached shortest-path tree for a destination, so repeat destinations skip the search"""
+    trees = WORKER["route_trees"]
+    key = (destination.segment, round(destination.fraction, 3))
+    tree = trees.get(key)
+    if tree is None:
+        tree = RouteTree(WORKER["network"], destination)
+        trees[key] = tree
+        if len(trees) > ROUTE_TREE_CACHE_SIZE:
+            trees.popitem(last=False)
+    else:
+        trees.move_to_end(key)
+    return tree
+
+def route_query(args):
+    network = WORKER["network"]
+    origin = network.locate(*args["from"])
+    destination = network.locate(*args["to"])
+    origin_snap = origin.distance * MERCATOR_SCALE
+    dest_snap = destination.distance * MERCATOR_SCALE
+    snaps = {"origin_snap_m": round(origin_snap, 1), "dest_snap_m": round(dest_snap, 1)}
+
+    # Same cutoff the map and batch routing snap within
+    if max(origin_snap, dest_snap) > MAX_SEARCH_RADIUS:
+        return {"reachable": False, "reason": "too far from the network", **snaps}
+
+    distance, coords = route_tree(destination).route_from(origin)
+    if not coords:
+        return {"reachable": False, "reason": "no connecting path", **snaps}
+
+    # Distances include the walk between each endpoint and the network
+    distance += origin_snap + dest_snap
+    return {
+        "reachable": True,
+        "distance_m": round(distance, 1),
+        "time_s": round(distance / WALKING_SPEED, 1),
+        **snaps,
+        "path": lon_lat_coords([args["from"]] + coords + [args["to"]]),
+    }
+
+def nearest_business_query(args):
+    network = WORKER["network"]
+    start = network.locate(*args["at"])
+    limit = args["limit"]
+
+    isochrone = Isochrone(network, start, thresholds=(MAX_NEAREST_MINUTES,))
+    costs = isochrone.business_costs(WORKER["business_access"])
+    reachable = np.flatnonzero(np.isfinite(costs))
+    nearest = reachable[np.argsort(costs[reachable], kind="stable")[:limit]]
+
+    lons, lats = to_lon_lat(WORKER["business_x"][nearest], WORKER["business_y"][nearest])
+    return {"businesses": [
+        {
+            "busid": WORKER["business_busids"][i],
+            "tradename": WORKER["business_names"][i],
+            "distance_m": round(float(costs[i]), 1),
+            "time_s": round(float(costs[i]) / WALKING_SPEED, 1),
+            "lon": round(float(lon), 7),
+            "lat": round(float(lat), 7),
+        }
+        for i, lon, lat in zip(nearest, lons, lats)
+    ]}
+
+def isochrone_query(args):
+    network = WORKER["network"]
+    start = network.locate(*args["at"])
+    isochrone = Isochrone(network, start, args["minutes"])
+    bands = []
+    for minutes in isochrone.thresholds:
+        pieces = isochrone.segment_pieces(minutes)
+        businesses = isochrone.reachable_businesses(WORKER["business_access"], minutes)
+        bands.append({
+            "minutes": minutes,
+            "segments": [lon_lat_coords(piece) for piece in pieces],
+            "businesses": [WORKER["business_busids"][i] for i in businesses],
+        })
+    return {"bands": bands}
+
+# Endpoint -> (argument parser run in the front end, query run in a worker)
+QUERIES = {
+    "/route": (route_args, route_query),
+    "/nearest-business": (nearest_business_args, nearest_business_query),
+    "/isochrone": (isochrone_args, isochrone_query),
+}
+
+def run_query(path, args):
+    """Runs in a worker process on arguments already validated by the front end"""
+    return 200, QUERIES[path][1](args)
+
+class RouteService:
+    """Asyncio HTTP front end dispatching searches to a process pool"""
+    def __init__(self, network, business_df, workers=None):
+        business_x, business_y = businessPoints(business_df)
+        access = network.locate_many(business_x, business_y)
+
+        # Graph and business arrays are copied into shared memory once; workers map them read-only
+        arrays = network.arrays()
+        arrays.update(
+            business_x=business_x,
+            business_y=business_y,
+            business_segment=access[0],
+            business_fraction=access[1],
+            business_distance=access[2],
+        )
+        self.shared = SharedArrays(arrays)
+
+        busid_column = "getbusid" if "getbusid" in business_df.columns else "busid"
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            initializer=init_worker,
+            initargs=(self.shared.spec, business_df[busid_column].tolist(),
+                      business_df["tradename"].fillna("").astype(str).tolist()),
+        )
+        self.in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self.stats = LatencyStats(max_samples=10000)
+        self.status_counts = {}
+
+    async def handle_connection(self, reader, writer):
+        """Serve keep-alive HTTP/1.1 requests on one connection"""
+        try:
+            while True:
+                # Lines longer than the stream limit (MAX_REQUEST_LINE) raise ValueError
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+
+                    headers = {}
+                    for _ in range(MAX_HEADERS + 1):
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    else:
+                        raise ValueError("too many header lines")
+                except ValueError:
+                    self.write_response(writer, 431, {"error": "request line or headers too large"}, False)
+                    await writer.drain()
+                    break
+
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                # The body can't be skipped without reading it, so these close the connection
+                if length < 0:
+                    self.write_response(writer, 400, {"error": "invalid Content-Length"}, False)
+                    await writer.drain()
+                    break
+                if length > MAX_BODY:
+                    self.write_response(writer, 413, {"error": f"body larger than {MAX_BODY} bytes"}, False)
+                    await writer.drain()
+                    break
+
+                body = b""
+                if length:
+                    body = await reader.readexactly(length)
+
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+
+                status, payload = await self.dispatch(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def write_response(self, writer, status, payload, keep_alive):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                   413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+        )
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if method == "POST" and body:
+            try:
+                fields = json.loads(body)
+            except ValueError:
+                fields = None
+            if not isinstance(fields, dict):
+                return 400, {"error": "body must be a JSON object"}
+            params.update(fields)
+        elif method not in ("GET", "POST"):
+            return 405, {"error": f"{method} not allowed"}
+
+        if url.path == "/metrics":
+            return 200, {"latency_ms": self.stats.summary(), "status": self.status_counts}
+        if url.path == "/health":
+            return 200, {"status": "ok"}
+        if url.path not in QUERIES:
+            return 404, {"error": f"unknown endpoint {url.path}"}
+
+        # Bad parameters are answered here without taking a worker
+        try:
+            args = QUERIES[url.path][0](params)
+        except QueryError as e:
+            return 400, {"error": str(e)}
+
+        start = time.perf_counter()
+        status, payload = await self.run(url.path, args)
+        self.stats.add(url.path, (time.perf_counter() - start) * 1000)
+        counts = self.status_counts.setdefault(url.path, {})
+        counts[status] = counts.get(status, 0) + 1
+        return status, payload
+
+    async def run(self, path, args):
+        if self.in_flight.locked():
+            return 503, {"error": "too many requests in flight"}
+
+        await self.in_flight.acquire()
+        loop = asyncio.get_running_loop()
+        job = self.pool.submit(run_query, path, args)
+        # The slot is held until the pool is done with the job, not just until the client gives up on it
+        job.add_done_callback(lambda _: loop.call_soon_threadsafe(self.in_flight.release))
+        try:
+            # Timing out cancels the job if it is still queued; a running one finishes in its slot
+            return await asyncio.wait_for(asyncio.wrap_future(job), QUERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            return 504, {"error": "query timed out"}
+        except Exception as e:
+            print(f"Query {path} failed: {e!r}")
+            return 500, {"error": "internal error"}
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_REQUEST_LINE)
+        print(f"+15 routing service listening on http://{host}:{port}")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+
+        async with server:
+            await stop.wait()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        self.shared.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve +15 routes over HTTP/JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    network = Plus15Network.from_lines(load_or_build().to_crs(epsg=3857))
+    service = RouteService(network, businessLocal(), args.workers)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    finally:
+        service.close()
+        service.stats.report(label="endpoint")
+
+if __name__ == "__main__":
+    main()
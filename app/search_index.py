@@ -0,0 +1,169 @@
+import os
+import re
+import heapq
+import pickle
+import unicodedata
+
+import pandas as pd
+
+from data import businessPoints
+
+SEARCH_INDEX_PATH = "calgary_businesses_search.pickle"
+INDEX_VERSION = 1
+
+NGRAM_SIZE = 3
+# Fraction of a query's n-grams a name must share to count as a fuzzy match
+MIN_NGRAM_OVERLAP = 0.5
+
+NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+def normalize(text):
+    """Case- and accent-insensitive form of a name: 'Café Olé!' -> 'cafe ole'"""
+    if not isinstance(text, str):
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return NON_ALNUM.sub(" ", stripped.casefold()).strip()
+
+def ngrams(text, n=NGRAM_SIZE):
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+def frame_signature(business_df):
+    """Cheap content hash of the columns the index is built from"""
+    columns = [c for c in ("getbusid", "tradename", "point") if c in business_df.columns]
+    return int(pd.util.hash_pandas_object(business_df[columns].astype(str), index=False).sum())
+
+class BusinessSearchIndex:
+    """Prefix trie plus n-gram index over business trade names.
+
+    Every trie node keeps the ids of the businesses that have a name token
+    starting with that node's prefix, so a prefix lookup is one walk down the
+    trie with no subtree traversal. Queries that match no token prefix (typos,
+    mid-word fragments) fall back to n-gram overlap.
+    """
+    def __init__(self, names, busids, xs, ys, signature=None):
+        self.names = list(names)
+        self.busids = list(busids)
+        self.xs = list(xs)
+        self.ys = list(ys)
+        self.signature = signature
+
+        self.normalized = [normalize(name) for name in self.names]
+        self.trie = {}
+        self.ngram_index = {}
+        self.build()
+
+    @classmethod
+    def from_frame(cls, business_df):
+        xs, ys = businessPoints(business_df)
+        names = business_df["tradename"].fillna("").astype(str).tolist()
+        busid_column = "getbusid" if "getbusid" in business_df.columns else "busid"
+        return cls(names, business_df[busid_column].tolist(), xs.tolist(), ys.tolist(),
+                   signature=frame_signature(business_df))
+
+    @classmethod
+    def load_or_build(cls, business_df, path=SEARCH_INDEX_PATH):
+        """Load the persisted index if it was built from this data, otherwise rebuild and save it"""
+        signature = frame_signature(business_df)
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    version, index = pickle.load(f)
+                if version == INDEX_VERSION and index.signature == signature:
+                    print(f"Loaded search index for {len(index.names)} businesses from {path}")
+                    return index
+            except Exception as e:
+                print(f"Ignoring unreadable search index {path}: {e}")
+
+        index = cls.from_frame(business_df)
+        index.save(path)
+        return index
+
+    def save(self, path=SEARCH_INDEX_PATH):
+        with open(path, "wb") as f:
+            pickle.dump((INDEX_VERSION, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"Saved search index for {len(self.names)} businesses to {path}")
+
+    def build(self):
+        trie_ids = {}
+        for doc_id, name in enumerate(self.normalized):
+            for token in set(name.split()):
+                node = self.trie
+                for depth in range(1, len(token) + 1):
+                    node = node.setdefault(token[depth - 1], {})
+                    trie_ids.setdefault(id(node), (node, set()))[1].add(doc_id)
+
+            for gram in ngrams(name):
+                self.ngram_index.setdefault(gram, []).append(doc_id)
+
+        # Postings are stored under the empty key so they never clash with a child character
+        for node, ids in trie_ids.values():
+            node[""] = tuple(sorted(ids))
+
+    def prefix_ids(self, token):
+        node = self.trie
+        for char in token:
+            node = node.get(char)
+            if node is None:
+                return ()
+        return node.get("", ())
+
+    def prefix_matches(self, tokens):
+        """Businesses with a name token starting with every query token"""
+        postings = sorted((self.prefix_ids(token) for token in tokens), key=len)
+        if not postings or not postings[0]:
+            return set()
+        matches = set(postings[0])
+        for ids in postings[1:]:
+            matches.intersection_update(ids)
+            if not matches:
+                break
+        return matches
+
+    def ngram_matches(self, query):
+        grams = ngrams(query)
+        counts = {}
+        for gram in grams:
+            for doc_id in self.ngram_index.get(gram, ()):
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+        needed = max(1, int(len(grams) * MIN_NGRAM_OVERLAP))
+        return {doc_id: count for doc_id, count in counts.items() if count >= needed}
+
+    def search(self, text, limit=10):
+        """Ranked results as dicts with index, name, busid, x and y"""
+        query = normalize(text)
+        if not query:
+            return []
+
+        tokens = query.split()
+        matches = self.prefix_matches(tokens)
+
+        if matches:
+            first = tokens[0]
+
+            def rank(doc_id):
+                name = self.normalized[doc_id]
+                if name.startswith(query):
+                    tier = 0
+                elif name.startswith(first):
+                    tier = 1
+                else:
+                    tier = 2
+                return (tier, len(name), doc_id)
+
+            best = heapq.nsmallest(limit, matches, key=rank)
+        else:
+            scores = self.ngram_matches(query)
+            best = heapq.nsmallest(limit, scores, key=lambda doc_id: (-scores[doc_id], len(self.normalized[doc_id]), doc_id))
+
+        return [self.result(doc_id) for doc_id in best]
+
+    def result(self, doc_id):
+        return {
+            "index": doc_id,
+            "name": self.names[doc_id],
+            "busid": self.busids[doc_id],
+            "x": self.xs[doc_id],
+            "y": self.ys[doc_id],
+        }
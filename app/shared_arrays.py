@@ -0,0 +1,33 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+class SharedArrays:
+    """Named numpy arrays copied once into shared memory blocks that other processes attach to"""
+    def __init__(self, arrays):
+        self.blocks = []
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        """Release and remove the blocks; call once, from the creating process"""
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+def attach_arrays(spec):
+    """Read-only array views onto blocks created by SharedArrays, plus the handles keeping them mapped"""
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+        blocks.append(block)
+    return arrays, blocks
@@ -0,0 +1,145 @@
+"""Decoded tiles packed into one memory-mapped file that several processes can share.
+
+    python app/shared_tiles.py tiles_cartodb_positron tiles_overlay/network
+
+Writes <root>.rgba next to each tile tree. TileLayer maps the file read-only
+and wraps each tile's pixels in a QImage directly, so no process decodes the
+PNGs again and every process shares the same page-cache pages. Rebuild the
+store after downloading or transcoding tiles; tiles missing from it are
+still read from the tree.
+
+Layout: a 32 byte header (magic, version, tile size, tile count), an index of
+(z, x, y, offset) records sorted by z, x, y, then one page-aligned block of
+premultiplied 32-bit pixels (Qt's ARGB32 layout) per tile.
+"""
+import os
+import sys
+import mmap
+import struct
+import argparse
+
+import numpy as np
+from PySide6.QtGui import QImage
+
+MAGIC = b"P15TILES"
+VERSION = 1
+HEADER = struct.Struct("<8sIII12x")
+INDEX_DTYPE = np.dtype([("z", "<i4"), ("x", "<i4"), ("y", "<i4"), ("pad", "<i4"), ("offset", "<i8")])
+PAGE_SIZE = mmap.PAGESIZE
+IMAGE_FORMAT = QImage.Format_ARGB32_Premultiplied
+# Tile file formats, in the order TileLayer looks for them; transcode_tiles.py writes the others
+TILE_EXTENSIONS = (".png", ".webp", ".jpg")
+
+def store_path(root):
+    return os.path.normpath(root) + ".rgba"
+
+def align(offset):
+    return -(-offset // PAGE_SIZE) * PAGE_SIZE
+
+def find_tiles(root):
+    """(z, x, y, path) for every tile image in a z/x/y tree"""
+    tiles = []
+    for z in filter(str.isdigit, os.listdir(root)):
+        for x in filter(str.isdigit, os.listdir(os.path.join(root, z))):
+            for name in os.listdir(os.path.join(root, z, x)):
+                y, ext = os.path.splitext(name)
+                if y.isdigit() and ext in TILE_EXTENSIONS:
+                    tiles.append((int(z), int(x), int(y), os.path.join(root, z, x, name)))
+    return sorted(tiles)
+
+def build_store(root, path=None, tile_size=256):
+    """Decode every tile under root into a new store file; returns the number of tiles packed"""
+    path = path or store_path(root)
+    tiles = find_tiles(root)
+    tile_bytes = tile_size * tile_size * 4
+
+    index = np.zeros(len(tiles), dtype=INDEX_DTYPE)
+    data_start = align(HEADER.size + index.nbytes)
+    slot = align(tile_bytes)
+
+    # Write beside the old file and swap it in, so processes still mapping the old one are unaffected
+    temp_path = path + ".tmp"
+    count = 0
+    with open(temp_path, "wb") as f:
+        for z, x, y, tile_path in tiles:
+            image = QImage(tile_path)
+            if image.isNull() or image.width() != tile_size or image.height() != tile_size:
+                print(f"Skipping {tile_path}")
+                continue
+            image = image.convertToFormat(IMAGE_FORMAT)
+
+            offset = data_start + count * slot
+            f.seek(offset)
+            f.write(image.constBits().tobytes()[:tile_bytes])
+            index[count] = (z, x, y, 0, offset)
+            count += 1
+
+        f.truncate(data_start + count * slot)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, tile_size, count))
+        f.write(index[:count].tobytes())
+
+    os.replace(temp_path, path)
+    return count
+
+class SharedTileStore:
+    """Read-only view of a store file; images returned point straight into the mapping"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.tile_size, count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f"{path} is not a version {VERSION} tile store")
+
+        index = np.frombuffer(self.map, dtype=INDEX_DTYPE, count=count, offset=HEADER.size)
+        self.offsets = {(z, x, y): offset for z, x, y, offset in zip(
+            index["z"].tolist(), index["x"].tolist(), index["y"].tolist(), index["offset"].tolist())}
+        self.view = memoryview(self.map)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def zooms(self):
+        return sorted({z for z, _, _ in self.offsets})
+
+    def image(self, z, x, y):
+        """QImage over the tile's pixels in the mapping, or None if the tile isn't stored"""
+        offset = self.offsets.get((z, x, y))
+        if offset is None:
+            return None
+        size = self.tile_size
+        return QImage(self.view[offset:offset + size * size * 4], size, size, size * 4, IMAGE_FORMAT)
+
+def open_store(root):
+    """The store for a tile tree if one has been built, else None"""
+    path = store_path(root)
+    if not os.path.exists(path):
+        return None
+    try:
+        return SharedTileStore(path)
+    except (ValueError, OSError) as e:
+        print(f"Ignoring tile store {path}: {e}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack decoded tiles into shared memory-mapped stores")
+    parser.add_argument("roots", nargs="+", help="z/x/y tile trees to pack")
+    parser.add_argument("--tile-size", type=int, default=256)
+    args = parser.parse_args()
+
+    for root in args.roots:
+        if not os.path.isdir(root):
+            print(f"No tile tree at {root}")
+            sys.exit(1)
+        count = build_store(root, tile_size=args.tile_size)
+        size = os.path.getsize(store_path(root))
+        print(f"Packed {count} tiles from {root} into {store_path(root)} ({size / 2**20:.1f} MiB)")
+
+if __name__ == "__main__":
+    main()
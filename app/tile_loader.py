@@ -1,87 +1,233 @@
 import os
+import math
+import time
 import mercantile
-from PySide6.QtWidgets import QGraphicsPixmapItem
-from PySide6.QtGui import QPixmap
+from collections import OrderedDict
+from PySide6.QtWidgets import QGraphicsPixmapItem, QGraphicsItem
+from PySide6.QtGui import QPixmap, QImage
+from PySide6.QtCore import QRectF
 from pyproj import Transformer
 
+from shared_tiles import open_store, TILE_EXTENSIONS
+
 TILE_SIZE = 256
+# Basemap tree the map and overlay renderer use unless told otherwise
+BASEMAP_TILES = "tiles_cartodb_positron"
+
+# Decoded tiles kept in memory, shared by on-screen loads and prefetching
+TILE_CACHE_SIZE = 512
+
+# Half the width of the EPSG:3857 world
+WORLD_EXTENT = 20037508.342789244
 
 transformer = Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True)
 
-class TileLayer:
-    def __init__(self, scene, tiles_root="tiles", tile_size=256):
-        self.scene = scene
-        self.tiles_root = tiles_root
-        self.tiles = {}
-        self.tile_size = tile_size  # Support different tile sizes
+def available_zooms(root):
+    """Zoom levels with a directory under a z/x/y tile tree"""
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(name) for name in os.listdir(root) if name.isdigit())
 
-    def update_tiles(self, rect, zoom):
-        self.clear_tiles()
+class TileCache:
+    """Decoded tiles by (root, z, x, y), least recently used evicted first; missing tiles are cached as None"""
+    def __init__(self, max_tiles=TILE_CACHE_SIZE):
+        self.max_tiles = max_tiles
+        self.pixmaps = OrderedDict()
 
-        left_m = rect.left()
-        right_m = rect.right()
-        top_m = rect.top()
-        bottom_m = rect.bottom()
+    def __contains__(self, key):
+        return key in self.pixmaps
 
-        min_y = min(top_m, bottom_m)
-        max_y = max(top_m, bottom_m)
+    def get(self, key):
+        self.pixmaps.move_to_end(key)
+        return self.pixmaps[key]
 
-        left_lon, south_lat = transformer.transform(left_m, min_y)
-        right_lon, north_lat = transformer.transform(right_m, max_y)
+    def put(self, key, pixmap):
+        self.pixmaps[key] = pixmap
+        if len(self.pixmaps) > self.max_tiles:
+            self.pixmaps.popitem(last=False)
 
-        print(f"Request bounds EPSG:3857 -> Lon/Lat:")
-        print(f"Left: {left_m}, Right: {right_m}, Top: {top_m}, Bottom: {bottom_m}")
-        print(f"Lon/Lat bounds: West={left_lon}, East={right_lon}, North={north_lat}, South={south_lat}")
+class TileImageItem(QGraphicsItem):
+    """Draws a QImage as is, so tiles backed by a shared store are never copied into a pixmap"""
+    def __init__(self, image):
+        super().__init__()
+        self.image = image
 
-        tiles = list(mercantile.tiles(left_lon, south_lat, right_lon, north_lat, zoom))
-        print(f"Tiles requested: {len(tiles)}")
+    def boundingRect(self):
+        return QRectF(0, 0, self.image.width(), self.image.height())
 
-        for tile in tiles:
-            key = (tile.z, tile.x, tile.y)
-            if key in self.tiles:
-                continue
+    def paint(self, painter, option, widget=None):
+        painter.drawImage(0, 0, self.image)
+
+class TileLayer:
+    def __init__(self, scene, tiles_root="tiles", tile_size=256, overlay_roots=None, shared_tiles=True):
+        self.scene = scene
+        self.tiles_root = tiles_root
+        self.tiles = {}
+        self.tile_size = tile_size  # Support different tile sizes
 
-            pixmap = self.load_tile_from_disk(tile)
-            if pixmap is None:
+        # Pre-rendered transparent layers drawn over the basemap, by layer name
+        self.overlay_roots = dict(overlay_roots or {})
+        self.overlay_visible = {name: True for name in self.overlay_roots}
+        self.overlay_tiles = {}
+
+        self.cache = TileCache()
+        self.disk_reads = 0
+        roots = [tiles_root] + list(self.overlay_roots.values())
+        self.zoom_levels = {root: available_zooms(root) for root in roots}
+        # Pre-decoded tiles shared with other processes, for trees packed by shared_tiles.py
+        self.stores = {}
+        for root in roots if shared_tiles else []:
+            store = open_store(root)
+            if store is None:
                 continue
+            self.stores[root] = store
+            self.zoom_levels[root] = sorted(set(self.zoom_levels[root]) | set(store.zooms()))
+            print(f"Using shared tile store {store.path} ({len(store)} tiles)")
+        # When the last on-screen update had to read from disk, so prefetching can stay out of its way
+        self.last_load = 0.0
+
+    def pick_zoom(self, meters_per_pixel):
+        """Available basemap zoom whose tiles come closest to one tile pixel per screen pixel"""
+        ideal = math.log2(2 * WORLD_EXTENT / (self.tile_size * meters_per_pixel))
+        levels = self.zoom_levels[self.tiles_root]
+        if not levels:
+            return round(ideal)
+        return min(levels, key=lambda level: abs(level - ideal))
+
+    def adjacent_zoom(self, zoom, direction):
+        """Next available basemap zoom above (direction > 0) or below the given one"""
+        levels = self.zoom_levels[self.tiles_root]
+        candidates = [level for level in levels if (level > zoom if direction > 0 else level < zoom)]
+        if not candidates:
+            return None
+        return min(candidates) if direction > 0 else max(candidates)
+
+    def tiles_in(self, rect, zoom):
+        min_y = min(rect.top(), rect.bottom())
+        max_y = max(rect.top(), rect.bottom())
+        left_lon, south_lat = transformer.transform(rect.left(), min_y)
+        right_lon, north_lat = transformer.transform(rect.right(), max_y)
+        return list(mercantile.tiles(left_lon, south_lat, right_lon, north_lat, zoom))
+
+    def resolve(self, tile, root):
+        """The tile itself, or its closest available ancestor, with its decoded pixmap"""
+        for level in reversed(self.zoom_levels[root]):
+            if level > tile.z:
+                continue
+            source = tile if level == tile.z else mercantile.parent(tile, zoom=level)
+            pixmap = self.load_tile_from_disk(source, root)
+            if pixmap is not None:
+                return source, pixmap
+        return None, None
 
-            bounds = mercantile.xy_bounds(tile)
-            x = bounds.left
-            y = bounds.top 
-            width = bounds.right - bounds.left
-            height = bounds.top - bounds.bottom
+    def is_cached(self, tile):
+        return (self.tiles_root, tile.z, tile.x, tile.y) in self.cache
 
-            item = QGraphicsPixmapItem(pixmap)
-            item.setScale(width / self.tile_size) 
-            item.setTransform(item.transform().scale(1, -1))
-            item.setPos(x, y)
-            item.setZValue(-10)
-            self.scene.addItem(item)
-            self.tiles[key] = item
-
-        print(f"Loaded {len(self.tiles)} tiles")
-
-    def get_tile_path(self, tile):
-        png_path = os.path.join(self.tiles_root, str(tile.z), str(tile.x), f"{tile.y}.png")
-        jpg_path = os.path.join(self.tiles_root, str(tile.z), str(tile.x), f"{tile.y}.jpg")
-        
-        if os.path.exists(png_path):
-            return png_path
-        elif os.path.exists(jpg_path):
-            return jpg_path
-        else:
-            return png_path 
+    def prefetch(self, tile):
+        """Decode a tile and its overlays into the cache without adding anything to the scene"""
+        self.resolve(tile, self.tiles_root)
+        for root in self.overlay_roots.values():
+            self.resolve(tile, root)
 
-    def load_tile_from_disk(self, tile):
-        path = self.get_tile_path(tile)
-        if not os.path.exists(path):
-            return None
-        pixmap = QPixmap(path)
-        if pixmap.isNull():
-            return None
+    def update_tiles(self, rect, zoom):
+        """Show the tiles covering rect, keeping items that are already in place"""
+        disk_reads = self.disk_reads
+        wanted = {}
+        wanted_overlays = {}
+        for tile in self.tiles_in(rect, zoom):
+            source, pixmap = self.resolve(tile, self.tiles_root)
+            if source is not None:
+                wanted[(source.z, source.x, source.y)] = (source, pixmap)
+
+            for name, root in self.overlay_roots.items():
+                source, pixmap = self.resolve(tile, root)
+                if source is not None:
+                    wanted_overlays[(name, source.z, source.x, source.y)] = (source, pixmap)
+
+        for items, keep in ((self.tiles, wanted), (self.overlay_tiles, wanted_overlays)):
+            for key in [key for key in items if key not in keep]:
+                self.scene.removeItem(items.pop(key))
+
+        for key, (tile, pixmap) in wanted.items():
+            if key not in self.tiles:
+                self.tiles[key] = self.add_tile_item(pixmap, tile, -10)
+
+        layers = list(self.overlay_roots)
+        for key, (tile, pixmap) in wanted_overlays.items():
+            if key not in self.overlay_tiles:
+                item = self.add_tile_item(pixmap, tile, -9 + layers.index(key[0]) * 0.1)
+                item.setVisible(self.overlay_visible[key[0]])
+                self.overlay_tiles[key] = item
+
+        if self.disk_reads != disk_reads:
+            self.last_load = time.perf_counter()
+            print(f"Loaded {self.disk_reads - disk_reads} tiles from disk at zoom {zoom}")
+
+    def add_tile_item(self, pixmap, tile, z_value):
+        bounds = mercantile.xy_bounds(tile)
+        x = bounds.left
+        y = bounds.top
+        width = bounds.right - bounds.left
+
+        if isinstance(pixmap, QImage):
+            item = TileImageItem(pixmap)
+        else:
+            item = QGraphicsPixmapItem(pixmap)
+        item.setScale(width / self.tile_size)
+        item.setTransform(item.transform().scale(1, -1))
+        item.setPos(x, y)
+        # Lower zoom fallbacks sit beneath sharper tiles
+        item.setZValue(z_value + tile.z * 0.001)
+        self.scene.addItem(item)
+        return item
+
+    def set_overlay_visible(self, name, visible):
+        """Show or hide one overlay layer without reloading its tiles"""
+        if name not in self.overlay_visible:
+            return
+        self.overlay_visible[name] = visible
+        for key, item in self.overlay_tiles.items():
+            if key[0] == name:
+                item.setVisible(visible)
+
+    def get_tile_path(self, tile, root=None):
+        root = root or self.tiles_root
+        base = os.path.join(root, str(tile.z), str(tile.x), str(tile.y))
+        for extension in TILE_EXTENSIONS:
+            if os.path.exists(base + extension):
+                return base + extension
+        return base + TILE_EXTENSIONS[0]
+
+    def load_tile_from_disk(self, tile, root=None):
+        """Decoded tile from the cache, else from a shared store, else read from disk; None if there is no such tile
+
+        Store hits are QImages pointing into the mapping; tiles read from disk are QPixmaps.
+        """
+        root = root or self.tiles_root
+        key = (root, tile.z, tile.x, tile.y)
+        if key in self.cache:
+            return self.cache.get(key)
+
+        store = self.stores.get(root)
+        if store is not None and (tile.z, tile.x, tile.y) in store:
+            image = store.image(tile.z, tile.x, tile.y)
+            self.cache.put(key, image)
+            return image
+
+        self.disk_reads += 1
+        pixmap = None
+        path = self.get_tile_path(tile, root)
+        if os.path.exists(path):
+            pixmap = QPixmap(path)
+            if pixmap.isNull():
+                pixmap = None
+        self.cache.put(key, pixmap)
         return pixmap
 
     def clear_tiles(self):
         for item in self.tiles.values():
             self.scene.removeItem(item)
-        self.tiles.clear()
\ No newline at end of file
+        self.tiles.clear()
+        for item in self.overlay_tiles.values():
+            self.scene.removeItem(item)
+        self.overlay_tiles.clear()
@@ -0,0 +1,104 @@
+import time
+from collections import deque
+from PySide6.QtCore import QObject, QTimer
+
+# View samples older than this don't count towards the current pan velocity (seconds)
+VELOCITY_WINDOW = 0.3
+# How far ahead the predicted viewport is placed (seconds)
+LOOKAHEAD = 0.5
+# Ignore drift slower than this fraction of the viewport width per second
+MIN_PAN_SPEED = 0.1
+# Width change over the velocity window that counts as zooming
+ZOOM_THRESHOLD = 0.05
+
+# Prefetching runs in short slices between on-screen work
+SLICE_INTERVAL_MS = 50
+SLICE_BUDGET_MS = 4
+# Stay idle this long after an on-screen update had to read tiles from disk (seconds)
+IDLE_AFTER_LOAD = 0.1
+MAX_PREFETCH_TILES = 64
+
+class TilePrefetcher(QObject):
+    """Warms the tile cache for where the view is heading, in small time-boxed slices
+
+    Each observed view change re-estimates pan velocity and zoom direction.
+    The predicted viewport at the current zoom and the current viewport at the
+    next zoom are queued; a changed prediction replaces (cancels) the queue.
+    """
+    def __init__(self, tile_layer, parent=None):
+        super().__init__(parent)
+        self.tile_layer = tile_layer
+        self.samples = deque()
+        self.queue = deque()
+        self.prediction = ()
+        self.prefetched = 0
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(SLICE_INTERVAL_MS)
+        self.timer.timeout.connect(self.run_slice)
+
+    def observe(self, rect, zoom):
+        now = time.perf_counter()
+        center = rect.center()
+        self.samples.append((now, center.x(), center.y(), rect.width()))
+        while now - self.samples[0][0] > VELOCITY_WINDOW:
+            self.samples.popleft()
+        self.predict(rect, zoom)
+
+    def motion(self):
+        """Pan velocity in scene units per second and zoom direction (+1 in, -1 out, 0 none)"""
+        if len(self.samples) < 2:
+            return 0.0, 0.0, 0
+        t0, x0, y0, w0 = self.samples[0]
+        t1, x1, y1, w1 = self.samples[-1]
+        dt = max(t1 - t0, 1e-3)
+        vx = (x1 - x0) / dt
+        vy = (y1 - y0) / dt
+        if (vx * vx + vy * vy) ** 0.5 < MIN_PAN_SPEED * w1:
+            vx = vy = 0.0
+
+        direction = 0
+        if w1 < w0 * (1 - ZOOM_THRESHOLD):
+            direction = 1
+        elif w1 > w0 * (1 + ZOOM_THRESHOLD):
+            direction = -1
+        return vx, vy, direction
+
+    def predict(self, rect, zoom):
+        vx, vy, direction = self.motion()
+        wanted = []
+        if vx or vy:
+            wanted += self.tile_layer.tiles_in(rect.translated(vx * LOOKAHEAD, vy * LOOKAHEAD), zoom)
+        next_zoom = self.tile_layer.adjacent_zoom(zoom, direction) if direction else None
+        if next_zoom is not None:
+            wanted += self.tile_layer.tiles_in(rect, next_zoom)
+
+        prediction = tuple(tile for tile in wanted if not self.tile_layer.is_cached(tile))[:MAX_PREFETCH_TILES]
+        if prediction == self.prediction:
+            return
+        # The view is heading somewhere else now; drop whatever was still queued
+        self.prediction = prediction
+        self.queue = deque(prediction)
+        if self.queue:
+            if not self.timer.isActive():
+                self.timer.start()
+        else:
+            self.timer.stop()
+
+    def run_slice(self):
+        """Load queued tiles until the slice budget is spent, unless on-screen loading just happened"""
+        now = time.perf_counter()
+        if now - self.tile_layer.last_load < IDLE_AFTER_LOAD:
+            return
+
+        deadline = now + SLICE_BUDGET_MS / 1000
+        while self.queue and time.perf_counter() < deadline:
+            self.tile_layer.prefetch(self.queue.popleft())
+            self.prefetched += 1
+        if not self.queue:
+            self.timer.stop()
+
+    def cancel(self):
+        self.queue.clear()
+        self.prediction = ()
+        self.timer.stop()
@@ -0,0 +1,54 @@
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile of an already sorted list of samples"""
+    if not sorted_samples:
+        return float("nan")
+    rank = max(1, math.ceil(q / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+class LatencyStats:
+    """Collects latency samples in milliseconds, grouped by a key"""
+    def __init__(self, max_samples=None):
+        self.max_samples = max_samples
+        self.samples = {}
+
+    def add(self, key, elapsed_ms):
+        if key not in self.samples:
+            self.samples[key] = deque(maxlen=self.max_samples)
+        self.samples[key].append(elapsed_ms)
+
+    @contextmanager
+    def measure(self, key):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(key, (time.perf_counter() - start) * 1000)
+
+    def summary(self):
+        """Count, mean and p50/p90/p99/max per key"""
+        result = {}
+        for key, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[key] = {
+                "count": len(ordered),
+                "mean": sum(ordered) / len(ordered) if ordered else float("nan"),
+                "p50": percentile(ordered, 50),
+                "p90": percentile(ordered, 90),
+                "p99": percentile(ordered, 99),
+                "max": ordered[-1] if ordered else float("nan"),
+            }
+        return result
+
+    def report(self, label="event"):
+        summary = self.summary()
+        width = max([len(label)] + [len(str(key)) for key in summary]) + 2
+        print(f"{label:<{width}}{'count':>8}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+        for key, row in sorted(summary.items()):
+            print(f"{key:<{width}}{row['count']:>8}{row['mean']:>10.2f}{row['p50']:>10.2f}"
+                  f"{row['p90']:>10.2f}{row['p99']:>10.2f}{row['max']:>10.2f}")
+        print("(latencies in ms)")
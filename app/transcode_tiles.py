@@ -0,0 +1,127 @@
+"""Transcode a basemap tile tree into a smaller format and report the trade-offs.
+
+    python app/transcode_tiles.py tiles_cartodb_positron --format webp
+    python app/transcode_tiles.py tiles_cartodb_positron --format png8 --output tiles_small
+
+Formats:
+    png8           palette PNG, 256 colours chosen per tile
+    png-max        lossless PNG at maximum compression
+    webp           lossy WebP
+    webp-lossless  lossless WebP
+
+The output is a new z/x/y tree (default <root>_<format>) that TileLayer reads
+like any other; run the map with --tiles <output> to use it.
+"""
+import os
+import time
+import argparse
+
+import numpy as np
+from PySide6.QtCore import QBuffer, QByteArray, QIODevice
+from PySide6.QtGui import QImage, QImageWriter
+
+from shared_tiles import find_tiles
+
+FORMATS = {
+    "png8": {"writer": "png", "extension": ".png", "quality": -1, "palette": True},
+    "png-max": {"writer": "png", "extension": ".png", "quality": 0, "palette": False},
+    "webp": {"writer": "webp", "extension": ".webp", "quality": 80, "palette": False},
+    # Qt's WebP writer switches to lossless encoding at quality 100
+    "webp-lossless": {"writer": "webp", "extension": ".webp", "quality": 100, "palette": False},
+}
+DECODE_REPEATS = 3
+
+def pixels(image):
+    """Premultiplied ARGB32 pixels as a (height, width) uint32 array"""
+    image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+    array = np.frombuffer(image.constBits(), dtype=np.uint32, count=image.width() * image.height())
+    return array.reshape(image.height(), image.width()).copy()
+
+def palette_image(image):
+    """Indexed copy of image using its 256 most frequent colours, other colours mapped to the nearest"""
+    colors, counts = np.unique(pixels(image), return_counts=True)
+    table = colors[np.argsort(counts)[::-1][:256]].tolist()
+    return image.convertToFormat(QImage.Format_Indexed8, table)
+
+def encode(image, spec):
+    if spec["palette"]:
+        image = palette_image(image)
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    writer = QImageWriter(buffer, spec["writer"].encode())
+    writer.setQuality(spec["quality"])
+    if not writer.write(image):
+        raise RuntimeError(f"{spec['writer']} encoding failed: {writer.errorString()}")
+    return bytes(data)
+
+def decode_ms(data):
+    """Best of a few in-memory decodes, so disk caching doesn't skew the comparison"""
+    best = float("inf")
+    for _ in range(DECODE_REPEATS):
+        start = time.perf_counter()
+        QImage.fromData(data)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+def psnr(a, b):
+    """Peak signal-to-noise ratio in dB between two ARGB32 pixel arrays (inf when identical)"""
+    a = a.view(np.uint8).astype(np.float64)
+    b = b.view(np.uint8).astype(np.float64)
+    mse = np.mean((a - b) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+def transcode(root, output, format_name):
+    """Write every tile under root to output in the given format; returns per-zoom statistics"""
+    spec = FORMATS[format_name]
+    stats = {}
+    for z, x, y, path in find_tiles(root):
+        with open(path, "rb") as f:
+            source = f.read()
+        image = QImage.fromData(source)
+        if image.isNull():
+            print(f"Skipping {path}")
+            continue
+
+        data = encode(image, spec)
+        out_dir = os.path.join(output, str(z), str(x))
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, f"{y}{spec['extension']}"), "wb") as f:
+            f.write(data)
+
+        row = stats.setdefault(z, {"tiles": 0, "source_bytes": 0, "output_bytes": 0,
+                                   "source_ms": 0.0, "output_ms": 0.0, "psnr": []})
+        row["tiles"] += 1
+        row["source_bytes"] += len(source)
+        row["output_bytes"] += len(data)
+        row["source_ms"] += decode_ms(source)
+        row["output_ms"] += decode_ms(data)
+        row["psnr"].append(psnr(pixels(image), pixels(QImage.fromData(data))))
+    return stats
+
+def report(stats, format_name):
+    print(f"{'zoom':>4}{'tiles':>7}{'source KiB':>12}{format_name + ' KiB':>{max(12, len(format_name) + 6)}}"
+          f"{'ratio':>8}{'decode ms':>11}{'was ms':>9}{'min PSNR':>10}")
+    for z, row in sorted(stats.items()):
+        worst = min(row["psnr"])
+        print(f"{z:>4}{row['tiles']:>7}{row['source_bytes'] / 1024:>12.0f}"
+              f"{row['output_bytes'] / 1024:>{max(12, len(format_name) + 6)}.0f}"
+              f"{row['output_bytes'] / row['source_bytes']:>8.2f}"
+              f"{row['output_ms'] / row['tiles']:>11.2f}{row['source_ms'] / row['tiles']:>9.2f}"
+              f"{'lossless' if worst == float('inf') else f'{worst:.1f} dB':>10}")
+    print("(decode times are per tile, best of in-memory decodes)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcode a z/x/y tile tree into a smaller format")
+    parser.add_argument("root", help="tile tree to transcode")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="webp")
+    parser.add_argument("--output", default=None, help="output tree (default <root>_<format>)")
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.normpath(args.root)}_{args.format.replace('-', '_')}"
+    stats = transcode(args.root, output, args.format)
+    report(stats, args.format)
+    print(f"Wrote {sum(row['tiles'] for row in stats.values())} tiles to {output}")
+
+if __name__ == "__main__":
+    main()